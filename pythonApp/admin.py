@@ -3,41 +3,65 @@ from flask import Blueprint, request, jsonify
 import os
 import re
 import io
-import sqlite3
 import tempfile
+import threading
 import traceback
+import uuid
 from collections import defaultdict
+from contextlib import contextmanager
+from concurrent.futures import wait
+from datetime import datetime
 
-import boto3
 import fitz  # PyMuPDF
 import nltk
-from nltk.tokenize.punkt import PunktSentenceTokenizer, PunktParameters
-from PIL import Image
-import pytesseract
 
 import torch
 from transformers import AutoTokenizer, AutoModel
 
-# ---------------------- CONFIG ----------------------
-s3 = boto3.client("s3")
-S3_BUCKET = os.environ.get("S3_PDF_BUCKET", "geolabs-db-pdfs")
+from db_pool import connect, discard, pool_stats
+from history_writer import submit as submit_history, writer_stats
+from jobs import enqueue, register_handler, staging_path
+import page_cache
+import thumbnails
+from s3_storage import s3, S3_BUCKET, upload_pdf_to_s3, upload_pdf_to_s3_async
+import s3_catalog
+from s3_catalog import listing_response
+from chunking import CHUNK_SIZE, OVERLAP, iter_chunks
+from pipeline import Stage
+from extraction import OCR_WORKERS, iter_page_texts, iter_document_sentences
 
+# ---------------------- CONFIG ----------------------
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 UPLOAD_FOLDER = os.path.join(BASE_DIR, "uploads")
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 DB_FILE = os.path.join(UPLOAD_FOLDER, "chat_history.db")
 
-# Optional: set this only if you know the path. Otherwise comment it out.
-# pytesseract.pytesseract.tesseract_cmd = r"C:\Users\tyamashita\AppData\Local\Programs\Tesseract-OCR\tesseract.exe"
-
 # Embedding model (same as your previous code)
 MODEL_NAME = "BAAI/bge-base-en-v1.5"
 tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
 embedding_model = AutoModel.from_pretrained(MODEL_NAME)
-
-CHUNK_SIZE = 800
-OVERLAP = 200
+# Fast tokenizers switch padding/truncation state per call and aren't safe to share across
+# threads ("Already borrowed"); the chunk and embed stages both use it, so calls go through tokenize()
+_tokenizer_lock = threading.Lock()
+
+# Chunking: 'tokens' measures with the embedding tokenizer so chunks fit the model window
+# (512 incl. [CLS]/[SEP]) instead of being cut off by truncation=True; 'words' is the old 800/200.
+CHUNK_MODE = os.environ.get("CHUNK_MODE", "tokens").strip().lower()
+CHUNK_TOKENS = int(os.environ.get("CHUNK_TOKENS", "510"))
+OVERLAP_TOKENS = int(os.environ.get("OVERLAP_TOKENS", "64"))
+
+# Stored per file in file_manifest; bump when the model or chunking changes so files re-index
+if CHUNK_MODE == "tokens":
+    EMBED_VERSION = f"{MODEL_NAME}|tokens:{CHUNK_TOKENS}/{OVERLAP_TOKENS}"
+else:
+    EMBED_VERSION = f"{MODEL_NAME}|words:{CHUNK_SIZE}/{OVERLAP}"
+
+# Streaming ingestion: chunks are embedded EMBED_BATCH at a time, and each stage queue holds
+# at most PIPELINE_DEPTH items (pages / batches), so memory stays flat for any PDF size. Each
+# finished batch is committed to a staging table and swapped in for the live rows at the end.
+EMBED_BATCH = int(os.environ.get("EMBED_BATCH", "16"))
+PIPELINE_DEPTH = int(os.environ.get("PIPELINE_DEPTH", "4"))
 
 # NLTK punkt
 try:
@@ -45,18 +69,12 @@ try:
 except LookupError:
     nltk.download('punkt')
 
-punkt_param = PunktParameters()
-punkt_tokenizer = PunktSentenceTokenizer(punkt_param)
-
-def safe_sent_tokenize(text):
-    return punkt_tokenizer.tokenize(text)
-
 admin_bp = Blueprint('admin', __name__)
 
 # ---------------------- DB bootstrap ----------------------
 def ensure_upload_history_table():
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with connect(DB_FILE) as conn:
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS upload_history (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -72,91 +90,31 @@ def ensure_upload_history_table():
 ensure_upload_history_table()
 
 # ---------------------- Helpers ----------------------
-def upload_pdf_to_s3(local_path, db_name, file_name, prefix=""):
-    """Uploads to s3 as {db_name}/{prefix}/{file_name} and returns a presigned URL"""
-    key = "/".join(x for x in [db_name.strip("/"), prefix.strip("/"), file_name] if x).replace("//", "/")
-    try:
-        s3.upload_file(
-            Filename=local_path,
-            Bucket=S3_BUCKET,
-            Key=key,
-            ExtraArgs={"ContentType": "application/pdf"}
-        )
-        url = s3.generate_presigned_url(
-            "get_object",
-            Params={"Bucket": S3_BUCKET, "Key": key},
-            ExpiresIn=3600,
-        )
-        print(f"✅ Uploaded to S3: {key}")
-        return key, url
-    except Exception as e:
-        print(f"❌ S3 upload failed: {e}")
-        return None, None
-
 def log_upload_history(user, file, db_name):
+    # Written behind the request by history_writer; timestamp taken now, same format as datetime('now')
     try:
-        with sqlite3.connect(DB_FILE) as conn:
-            conn.execute("""
-                INSERT INTO upload_history (user, file, db_name, timestamp)
-                VALUES (?, ?, ?, datetime('now'))
-            """, (user or "guest", file, db_name))
+        submit_history(DB_FILE, """
+            INSERT INTO upload_history (user, file, db_name, timestamp)
+            VALUES (?, ?, ?, ?)
+        """, (user or "guest", file, db_name, datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")))
     except Exception as e:
         print("⚠️ Failed to log upload:", e)
 
 # ---------------------- Embedding utilities ----------------------
+def tokenize(texts, **kwargs):
+    with _tokenizer_lock:
+        return tokenizer(texts, **kwargs)
+
 def compute_embeddings(text_chunks):
-    inputs = tokenizer(text_chunks, padding=True, truncation=True, return_tensors="pt")
+    inputs = tokenize(text_chunks, padding=True, truncation=True, return_tensors="pt")
     with torch.no_grad():
         outputs = embedding_model(**inputs)
     embeddings = outputs.last_hidden_state.mean(dim=1)
     return embeddings.numpy()
 
-def extract_text_from_pdf_with_ocr_fallback(pdf_path, track=print):
-    doc = fitz.open(pdf_path)
-    full_text = []
-    for i, page in enumerate(doc):
-        txt = page.get_text().strip()
-        if txt:
-            track(f"✅ Page {i+1}: Found native text")
-            full_text.append(txt)
-        else:
-            track(f"🔍 Page {i+1}: No text found, running OCR…")
-            try:
-                pix = page.get_pixmap(dpi=300)
-                img_data = pix.tobytes("ppm")
-                img = Image.open(io.BytesIO(img_data))
-                ocr_text = pytesseract.image_to_string(img).strip()
-                if ocr_text:
-                    track(f"✅ Page {i+1}: OCR extracted {len(ocr_text.split())} words")
-                else:
-                    track(f"⚠️ Page {i+1}: OCR failed or empty")
-                full_text.append(ocr_text)
-            except Exception as e:
-                track(f"❌ OCR error on page {i+1}: {e}")
-    doc.close()
-    return "\n\n".join([t for t in full_text if t and t.strip()])
-
-def chunk_text(text, chunk_size=CHUNK_SIZE, overlap=OVERLAP):
-    sentences = safe_sent_tokenize(text)
-    chunks = []
-    current = []
-    for sentence in sentences:
-        current.append(sentence)
-        total_words = sum(len(s.split()) for s in current)
-        if total_words >= chunk_size:
-            chunks.append(' '.join(current))
-            # keep overlap
-            new_chunk = []
-            overlap_words = 0
-            for s in reversed(current):
-                overlap_words += len(s.split())
-                new_chunk.insert(0, s)
-                if overlap_words >= overlap:
-                    break
-            current = new_chunk
-    if current:
-        chunks.append(' '.join(current))
-    return chunks
+def token_count(text):
+    """Embedding-tokenizer length without special tokens."""
+    return len(tokenize(text, add_special_tokens=False)["input_ids"])
 
 def create_chunks_table(conn):
     conn.execute("""
@@ -164,10 +122,50 @@ def create_chunks_table(conn):
             file TEXT,
             chunk INTEGER,
             text TEXT,
-            embedding BLOB
+            embedding BLOB,
+            token_count INTEGER
+        )
+    """)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(chunks)")}
+    if "token_count" not in columns:
+        conn.execute("ALTER TABLE chunks ADD COLUMN token_count INTEGER")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_file ON chunks(file)")
+    # One row per indexed file: lets identical re-uploads be skipped and changed ones replaced
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS file_manifest (
+            file TEXT PRIMARY KEY,
+            sha256 TEXT,
+            chunk_count INTEGER,
+            embed_version TEXT,
+            indexed_at TEXT
         )
     """)
 
+def get_file_manifest(db_path, file_name):
+    if not os.path.exists(db_path):
+        return None
+    with connect(db_path) as conn:
+        create_chunks_table(conn)
+        row = conn.execute(
+            "SELECT sha256, chunk_count, embed_version, indexed_at FROM file_manifest WHERE file = ?",
+            (file_name,)
+        ).fetchone()
+    if not row:
+        return None
+    return {"sha256": row[0], "chunk_count": row[1], "embed_version": row[2], "indexed_at": row[3]}
+
+def upsert_file_manifest(conn, file_name, sha256, chunk_count):
+    conn.execute("""
+        INSERT OR REPLACE INTO file_manifest (file, sha256, chunk_count, embed_version, indexed_at)
+        VALUES (?, ?, ?, ?, datetime('now'))
+    """, (file_name, sha256, chunk_count, EMBED_VERSION))
+
+def replace_file_chunks(conn, file_name, chunks, embeddings, sha256, token_counts=None):
+    """Swap one file's chunks and manifest row; run inside a single transaction."""
+    conn.execute("DELETE FROM chunks WHERE file = ?", (file_name,))
+    insert_chunks_with_embeddings(conn, file_name, chunks, embeddings, token_counts)
+    upsert_file_manifest(conn, file_name, sha256, len(chunks))
+
 def create_general_chunks_table(conn):
     conn.execute("""
         CREATE TABLE IF NOT EXISTS general_chunks (
@@ -177,95 +175,307 @@ def create_general_chunks_table(conn):
         )
     """)
 
-def insert_chunks_with_embeddings(conn, file_name, chunks, embeddings):
-    cur = conn.cursor()
-    for i, (chunk, emb) in enumerate(zip(chunks, embeddings)):
-        cur.execute(
-            "INSERT INTO chunks (file, chunk, text, embedding) VALUES (?, ?, ?, ?)",
-            (file_name, i, chunk, emb.tobytes())
+def create_staging_tables(conn):
+    """Rows of an in-progress ingest, keyed by run_id; search never reads these."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS chunks_staging (
+            run_id TEXT,
+            file TEXT,
+            chunk INTEGER,
+            text TEXT,
+            embedding BLOB,
+            token_count INTEGER
         )
-
-def insert_general_chunks(conn, chunks, embeddings):
-    cur = conn.cursor()
-    for chunk, emb in zip(chunks, embeddings):
-        cur.execute(
-            "INSERT INTO general_chunks (chunk, embedding) VALUES (?, ?)",
-            (chunk, emb.tobytes())
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_staging_run ON chunks_staging(run_id)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS general_chunks_staging (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id TEXT,
+            chunk TEXT,
+            embedding BLOB
         )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_general_chunks_staging_run ON general_chunks_staging(run_id)")
 
-def embed_to_db(input_pdf_path, db_path, file_name, track=print):
-    track(f"📄 Loading PDF: {file_name}")
-    try:
-        track("🔍 Extracting text…")
-        text = extract_text_from_pdf_with_ocr_fallback(input_pdf_path, track)
-        if not text.strip():
-            track(f"⚠️ No extractable text in: {file_name}")
-            return
-    except Exception as e:
-        track(f"❌ Error reading PDF: {e}")
-        return
-
-    track("✂️ Chunking text…")
-    chunks = chunk_text(text)
-    track(f"✅ Created {len(chunks)} chunks")
-    if not chunks:
-        track("⚠️ No chunks extracted.")
-        return
-
-    track("🧠 Embedding chunks…")
+# ---------------------- Bulk loading ----------------------
+@contextmanager
+def bulk_transaction(db_path):
+    """
+    One explicit transaction for a bulk load, with synchronous=OFF while it runs
+    (it can't change inside a transaction, so it wraps it). A power cut can lose the
+    last load, which the file manifest makes safe to redo; the previous level is restored after.
+    """
+    with connect(db_path) as conn:
+        previous = conn.execute("PRAGMA synchronous").fetchone()[0]
+        conn.execute("PRAGMA synchronous=OFF")
+        try:
+            conn.execute("BEGIN")
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        finally:
+            conn.execute(f"PRAGMA synchronous={int(previous)}")
+
+def bulk_insert(conn, sql, rows):
+    """executemany over any iterable (generators stream without building a list); returns row count."""
+    return conn.executemany(sql, rows).rowcount
+
+def chunk_rows(file_name, chunks, embeddings, token_counts=None, start=0):
+    token_counts = token_counts or [None] * len(chunks)
+    for i, (chunk, emb, n_tokens) in enumerate(zip(chunks, embeddings, token_counts), start):
+        yield (file_name, i, chunk, emb.tobytes(), n_tokens)
+
+def insert_chunks_with_embeddings(conn, file_name, chunks, embeddings, token_counts=None, start=0):
+    return bulk_insert(
+        conn,
+        "INSERT INTO chunks (file, chunk, text, embedding, token_count) VALUES (?, ?, ?, ?, ?)",
+        chunk_rows(file_name, chunks, embeddings, token_counts, start),
+    )
+
+def stage_chunks(conn, run_id, file_name, chunks, embeddings, token_counts=None, start=0):
+    return bulk_insert(
+        conn,
+        "INSERT INTO chunks_staging (run_id, file, chunk, text, embedding, token_count) VALUES (?, ?, ?, ?, ?, ?)",
+        ((run_id, *row) for row in chunk_rows(file_name, chunks, embeddings, token_counts, start)),
+    )
+
+def stage_general_chunks(conn, run_id, chunks, embeddings):
+    return bulk_insert(
+        conn,
+        "INSERT INTO general_chunks_staging (run_id, chunk, embedding) VALUES (?, ?, ?)",
+        ((run_id, chunk, emb.tobytes()) for chunk, emb in zip(chunks, embeddings)),
+    )
+
+def swap_in_staged_chunks(conn, run_id, file_name, sha256, expected):
+    """Replace one file's live chunks and manifest row with a finished run; run inside a single transaction."""
+    conn.execute("DELETE FROM chunks WHERE file = ?", (file_name,))
+    moved = conn.execute("""
+        INSERT INTO chunks (file, chunk, text, embedding, token_count)
+        SELECT file, chunk, text, embedding, token_count FROM chunks_staging WHERE run_id = ? ORDER BY chunk
+    """, (run_id,)).rowcount
+    if moved != expected:
+        raise RuntimeError(f"staged {moved} of {expected} chunks for {file_name} (superseded by another run?)")
+    # Leftovers of crashed runs for the same file go with it
+    conn.execute("DELETE FROM chunks_staging WHERE run_id = ? OR file = ?", (run_id, file_name))
+    upsert_file_manifest(conn, file_name, sha256, moved)
+
+def swap_in_staged_general_chunks(conn, run_id):
+    moved = conn.execute("""
+        INSERT INTO general_chunks (chunk, embedding)
+        SELECT chunk, embedding FROM general_chunks_staging WHERE run_id = ? ORDER BY id
+    """, (run_id,)).rowcount
+    conn.execute("DELETE FROM general_chunks_staging WHERE run_id = ?", (run_id,))
+    return moved
+
+# ---------------------- Streaming ingestion ----------------------
+# extract (OCR pool) -> sentences + chunker -> batched embedder -> staging writer (caller's thread),
+# each stage on its own thread behind a bounded queue, so OCR, inference and SQLite overlap.
+# Every batch is its own short transaction into a staging table; the live rows change only in
+# the final swap, so readers and other writers are never blocked for a whole document.
+_write_locks = {}
+_write_locks_lock = threading.Lock()
+
+def _db_write_lock(db_path):
+    """Serialises staging batches and swaps into the same DB file from concurrent jobs."""
+    key = os.path.abspath(db_path)
+    with _write_locks_lock:
+        return _write_locks.setdefault(key, threading.Lock())
+
+@contextmanager
+def staging_run(db_path):
+    """A run_id for staged rows; whatever the run left behind is dropped on the way out."""
+    run_id = uuid.uuid4().hex
+    with _db_write_lock(db_path), connect(db_path) as conn:
+        create_staging_tables(conn)
     try:
-        embeddings = compute_embeddings(chunks)
-    except Exception as e:
-        track(f"❌ Embedding failed: {e}")
+        yield run_id
+    finally:
+        try:
+            with _db_write_lock(db_path), connect(db_path) as conn:
+                conn.execute("DELETE FROM chunks_staging WHERE run_id = ?", (run_id,))
+                conn.execute("DELETE FROM general_chunks_staging WHERE run_id = ?", (run_id,))
+        except Exception as e:
+            print("⚠️ Could not clear staged chunks:", e)
+
+def iter_document_chunks(sentences):
+    """(chunk, token_count) per CHUNK_MODE; in 'words' mode the embedder fills in the count."""
+    if CHUNK_MODE == "tokens":
+        yield from iter_chunks(sentences, CHUNK_TOKENS, OVERLAP_TOKENS, length=token_count, hard_limit=True)
+    else:
+        for chunk, _ in iter_chunks(sentences, CHUNK_SIZE, OVERLAP):
+            yield chunk, None
+
+def _embed_batch(batch):
+    chunks = [c for c, _ in batch]
+    counts = [n for _, n in batch]
+    if any(n is None for n in counts):
+        counts = [len(ids) for ids in tokenize(chunks, add_special_tokens=False)["input_ids"]]
+    return chunks, compute_embeddings(chunks), counts
+
+def iter_embedded_batches(chunks, batch_size=EMBED_BATCH):
+    """Groups (chunk, token_count) pairs into (chunks, embeddings, token_counts) batches."""
+    batch = []
+    for item in chunks:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield _embed_batch(batch)
+            batch = []
+    if batch:
+        yield _embed_batch(batch)
+
+def stream_embedded_batches(pdf_path, track=print, pdf_sha=None):
+    """Starts the extract/chunk/embed stages; iterate the result for batches, close() it when done."""
+    pages = Stage(iter_page_texts(pdf_path, track, pdf_sha=pdf_sha),
+                  maxsize=max(PIPELINE_DEPTH, 2 * OCR_WORKERS), name="extract")
+    chunks = Stage(iter_document_chunks(iter_document_sentences(pages)),
+                   maxsize=PIPELINE_DEPTH * EMBED_BATCH, name="chunk", upstream=pages)
+    return Stage(iter_embedded_batches(chunks), maxsize=PIPELINE_DEPTH, name="embed", upstream=chunks)
+
+def embed_to_db(input_pdf_path, db_path, file_name, track=print, force=False):
+    track(f"📄 Loading PDF: {file_name}")
+    pdf_sha = page_cache.file_sha256(input_pdf_path)
+    thumbnails.pregenerate(input_pdf_path, pdf_sha, os.path.basename(db_path), file_name, track)
+    manifest = None if force else get_file_manifest(db_path, file_name)
+    if manifest and manifest["sha256"] == pdf_sha and manifest["embed_version"] == EMBED_VERSION:
+        track(f"⏭️ {file_name} unchanged since {manifest['indexed_at']} ({manifest['chunk_count']} chunks), skipping")
         return
 
-    track("💾 Writing to database…")
-    try:
-        conn = sqlite3.connect(db_path)
-        create_chunks_table(conn)
-        insert_chunks_with_embeddings(conn, file_name, chunks, embeddings)
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        track(f"❌ Database write failed: {e}")
-        return
+    track("🔍 Extracting text (chunking and embedding as pages arrive)…")
+    written, max_tokens = 0, 0
+    with staging_run(db_path) as run_id, stream_embedded_batches(input_pdf_path, track, pdf_sha) as batches:
+        try:
+            # Batches land in chunks_staging as they arrive; the old chunks stay live until the swap,
+            # so an unreadable PDF or a failed run leaves them untouched
+            for chunks, embeddings, counts in batches:
+                with _db_write_lock(db_path), bulk_transaction(db_path) as conn:
+                    written += stage_chunks(conn, run_id, file_name, chunks, embeddings, counts, start=written)
+                max_tokens = max(max_tokens, *counts)
+            if not written:
+                track(f"⚠️ No extractable text in: {file_name}")
+                return
+            track(f"✅ Created {written} chunks (max {max_tokens} tokens)")
+            track("💾 Committing to database…")
+            with _db_write_lock(db_path), bulk_transaction(db_path) as conn:
+                create_chunks_table(conn)
+                swap_in_staged_chunks(conn, run_id, file_name, pdf_sha, written)
+        except Exception as e:
+            # Re-raised so the job is recorded as failed instead of "✅ File indexed"
+            track(f"❌ Indexing failed, nothing written: {e}")
+            raise
 
-    track(f"🎉 Done! Indexed {len(chunks)} chunks into '{os.path.basename(db_path)}'")
+    verb = "Re-indexed" if manifest else "Indexed"
+    track(f"🎉 Done! {verb} {written} chunks into '{os.path.basename(db_path)}'")
 
 def embed_to_general_db(input_pdf_path, db_path, track=print):
     file_name = os.path.basename(input_pdf_path)
     track(f"📄 Loading PDF (general): {file_name}")
-    text = extract_text_from_pdf_with_ocr_fallback(input_pdf_path, track)
-    if not text.strip():
-        track("⚠️ Skipped empty or unreadable PDF.")
-        return
-
-    track("✂️ Chunking text…")
-    chunks = chunk_text(text)
-    track(f"✅ Created {len(chunks)} chunks")
-    if not chunks:
-        track("⚠️ No chunks extracted.")
-        return
-
-    track("🔢 Embedding…")
+    track("🔍 Extracting text (chunking and embedding as pages arrive)…")
+    written = 0
+    with staging_run(db_path) as run_id, stream_embedded_batches(input_pdf_path, track) as batches:
+        try:
+            for chunks, embeddings, _ in batches:
+                with _db_write_lock(db_path), bulk_transaction(db_path) as conn:
+                    written += stage_general_chunks(conn, run_id, chunks, embeddings)
+            if not written:
+                track("⚠️ Skipped empty or unreadable PDF.")
+                return
+            track(f"✅ Created {written} chunks")
+            track("💾 Committing to general_chunks table…")
+            with _db_write_lock(db_path), bulk_transaction(db_path) as conn:
+                create_general_chunks_table(conn)
+                written = swap_in_staged_general_chunks(conn, run_id)
+        except Exception as e:
+            track(f"❌ Indexing failed, nothing written: {e}")
+            raise
+
+    track(f"🎉 Done! Indexed {written} general chunks into '{os.path.basename(db_path)}'")
+
+# ---------------------- Ingestion job ----------------------
+# Rough progress for the pipeline stages announced through `track`
+STAGE_PROGRESS = (
+    ("📄 Loading PDF", 10),
+    ("🔍 Extracting text", 12),
+    ("✅ Created", 92),
+    ("💾 Committing", 95),
+)
+PAGE_PROGRESS = (12, 90)   # per-page messages; chunking/embedding/writing run alongside extraction
+PAGE_RE = re.compile(r"\bPage (\d+)")
+
+def _pdf_page_count(path):
     try:
-        embeddings = compute_embeddings(chunks)
-    except Exception as e:
-        track(f"❌ Embedding failed: {e}")
-        return
+        with fitz.open(path) as doc:
+            return doc.page_count
+    except Exception:
+        return 0
 
-    track("💾 Writing to general_chunks table…")
+def run_process_file(params, job):
+    """
+    Worker-side body of /api/process-file: S3 upload, extraction/OCR, chunking,
+    embedding and DB write. Messages and progress go to the job record.
+    """
+    tmp_path = params["tmp_path"]
+    db_name = params["db_name"]
+    original_filename = params["filename"]
+    upload = None
     try:
-        conn = sqlite3.connect(db_path)
-        create_general_chunks_table(conn)
-        insert_general_chunks(conn, chunks, embeddings)
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        track(f"❌ Database write failed: {e}")
-        return
+        pages = _pdf_page_count(tmp_path)
+
+        def track(msg):
+            progress = None
+            m = PAGE_RE.search(msg)
+            if m and pages:
+                lo, hi = PAGE_PROGRESS
+                progress = lo + (hi - lo) * int(m.group(1)) // pages
+            else:
+                for prefix, pct in STAGE_PROGRESS:
+                    if msg.startswith(prefix):
+                        progress = pct
+                        break
+            job.track(msg, progress)
+
+        # Upload to S3 under {db_name}/{filename} while the file is indexed
+        upload = upload_pdf_to_s3_async(tmp_path, db_name, original_filename)
+        job.track("☁️ Uploading to S3 in the background…", 5)
+
+        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+        db_path = os.path.join(UPLOAD_FOLDER, db_name)
+
+        # Index
+        if params.get("mode") == 'general':
+            embed_to_general_db(tmp_path, db_path, track)
+        else:
+            embed_to_db(tmp_path, db_path, original_filename, track, force=bool(params.get("force")))
+
+        key, s3_url = upload.result()
+        if key:
+            s3_catalog.record_put(key)
+        if s3_url:
+            job.track(f"☁️ Uploaded to S3: {s3_url}")
+        else:
+            job.track("⚠️ Failed to upload to S3")
+
+        # Log
+        try:
+            log_upload_history(params.get("user"), original_filename, db_name)
+        except Exception as e:
+            print("⚠️ Failed to log upload:", e)
+
+        return {"message": f"✅ File indexed into {db_name}!", "s3_key": key}
+    finally:
+        # The upload reads tmp_path, so it has to finish even if indexing raised
+        if upload is not None:
+            wait([upload])
+        try:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        except Exception:
+            pass
 
-    track(f"🎉 Done! Indexed {len(chunks)} general chunks into '{os.path.basename(db_path)}'")
+register_handler("process-file", run_process_file)
 
 # ---------------------- ROUTES USED BY DBAdmin.jsx ----------------------
 @admin_bp.route('/api/process-file', methods=['POST'])
@@ -276,59 +486,37 @@ def process_file():
       - db_name: target sqlite file name (e.g. my_docs.db)
       - mode: 'general' or anything else (default chunks)
       - user: optional
-    Returns: { message, steps[] }
+      - force: '1' to re-index even if the file is unchanged
+    Returns 202: { message, job_id }; poll /api/jobs/<job_id> for steps and progress.
     """
-    steps = []
+    file = request.files.get('file')
+    db_name = request.form.get('db_name')
+    mode = (request.form.get('mode') or '').strip().lower()
+    user = request.form.get("user", "guest")
+
+    if not file or not db_name:
+        return jsonify({'message': 'Missing file or database name'}), 400
+
+    tmp_path = staging_path(file.filename)
     try:
-      file = request.files.get('file')
-      db_name = request.form.get('db_name')
-      mode = (request.form.get('mode') or '').strip().lower()
-      user = request.form.get("user", "guest")
-
-      if not file or not db_name:
-          return jsonify({'message': 'Missing file or database name'}), 400
-
-      original_filename = file.filename
-      tmp_path = os.path.join(UPLOAD_FOLDER, original_filename)
-      file.save(tmp_path)
-
-      # Upload to S3 under {db_name}/{filename}
-      key, s3_url = upload_pdf_to_s3(tmp_path, db_name, original_filename)
-      if s3_url:
-          steps.append(f"☁️ Uploaded to S3: {s3_url}")
-      else:
-          steps.append("⚠️ Failed to upload to S3")
-
-      # Ensure uploads dir
-      os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-      db_path = os.path.join(UPLOAD_FOLDER, db_name)
-
-      def track(msg):
-          print(msg)
-          steps.append(msg)
-
-      # Index
-      if mode == 'general':
-          embed_to_general_db(tmp_path, db_path, track)
-      else:
-          embed_to_db(tmp_path, db_path, original_filename, track)
-
-      # Log
-      try:
-          log_upload_history(user, original_filename, db_name)
-      except Exception as e:
-          print("⚠️ Failed to log upload:", e)
-
-      os.remove(tmp_path)
-      return jsonify({'message': f"✅ File indexed into {db_name}!", 'steps': steps})
-    except Exception as e:
-      traceback.print_exc()
-      try:
-          if os.path.exists(tmp_path):
-              os.remove(tmp_path)
-      except Exception:
-          pass
-      return jsonify({'message': '❌ Failed to process file.'}), 500
+        file.save(tmp_path)
+        job_id = enqueue("process-file", {
+            "tmp_path": tmp_path,
+            "db_name": db_name,
+            "filename": file.filename,
+            "mode": mode,
+            "user": user,
+            "force": (request.form.get('force') or '').strip().lower() in {"1", "true", "yes"},
+        })
+        return jsonify({'message': f"⏳ Queued {file.filename} for {db_name}", 'job_id': job_id}), 202
+    except Exception:
+        traceback.print_exc()
+        try:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        except Exception:
+            pass
+        return jsonify({'message': '❌ Failed to process file.'}), 500
 
 @admin_bp.route('/api/list-dbs', methods=['GET'])
 def list_dbs():
@@ -348,36 +536,35 @@ def inspect_db():
         if not os.path.exists(db_path):
             return jsonify({'error': 'Database not found'}), 404
 
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        tables = [row[0] for row in cursor.fetchall()]
-
-        structure = {}
-        for table in tables:
-            cursor.execute(f"PRAGMA table_info({table})")
-            columns = [row[1] for row in cursor.fetchall()]
-
-            cursor.execute(f"SELECT * FROM {table} LIMIT 3")
-            sample_rows = cursor.fetchall()
-
-            safe_rows = []
-            for row in sample_rows:
-                safe_row = []
-                for val in row:
-                    if isinstance(val, (bytes, bytearray)):
-                        safe_row.append(f"<{len(val)} bytes>")
-                    else:
-                        safe_row.append(val)
-                safe_rows.append(safe_row)
-
-            structure[table] = {
-                "columns": columns,
-                "sample_rows": safe_rows
-            }
+        with connect(db_path) as conn:
+            cursor = conn.cursor()
+
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+            tables = [row[0] for row in cursor.fetchall()]
+
+            structure = {}
+            for table in tables:
+                cursor.execute(f"PRAGMA table_info({table})")
+                columns = [row[1] for row in cursor.fetchall()]
+
+                cursor.execute(f"SELECT * FROM {table} LIMIT 3")
+                sample_rows = cursor.fetchall()
+
+                safe_rows = []
+                for row in sample_rows:
+                    safe_row = []
+                    for val in row:
+                        if isinstance(val, (bytes, bytearray)):
+                            safe_row.append(f"<{len(val)} bytes>")
+                        else:
+                            safe_row.append(val)
+                    safe_rows.append(safe_row)
+
+                structure[table] = {
+                    "columns": columns,
+                    "sample_rows": safe_rows
+                }
 
-        conn.close()
         return jsonify(structure)
 
     except Exception as e:
@@ -399,7 +586,11 @@ def delete_db():
         if not os.path.exists(db_path):
             return jsonify({'error': 'Database not found'}), 404
 
-        os.remove(db_path)
+        # Pooled handles (and WAL side files) would otherwise keep the old DB alive
+        discard(db_path)
+        for path in (db_path, db_path + "-wal", db_path + "-shm"):
+            if os.path.exists(path):
+                os.remove(path)
         try:
             log_upload_history("admin", "[DELETED_DB]", db_name)
         except Exception as e:
@@ -425,30 +616,47 @@ def list_files_in_db():
         if not db_name or not os.path.exists(db_path):
             return jsonify({"error": "Database not found"}), 404
 
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT DISTINCT file FROM chunks")
-        files = [row[0] for row in cursor.fetchall()]
-        conn.close()
+        with connect(db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT DISTINCT file FROM chunks")
+            files = [row[0] for row in cursor.fetchall()]
 
         return jsonify({"files": files})
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": f"Failed to list files: {str(e)}"}), 500
 
+@admin_bp.route('/api/db-pool/stats', methods=['GET'])
+def db_pool_stats():
+    """Connection pool counters per DB file (opened / reused / idle / in_use)."""
+    return jsonify(pool_stats())
+
+@admin_bp.route('/api/history-writer/stats', methods=['GET'])
+def history_writer_stats():
+    """Write-behind queue counters (submitted / written / dropped / pending)."""
+    return jsonify(writer_stats())
+
+@admin_bp.route('/api/page-cache/stats', methods=['GET'])
+def page_cache_stats():
+    """Extracted-page cache size, hit/miss and eviction counters."""
+    try:
+        return jsonify(page_cache.cache_stats())
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
 @admin_bp.route('/api/upload-history', methods=['GET'])
 def get_upload_history():
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT user, file, db_name, timestamp
-            FROM upload_history
-            ORDER BY timestamp DESC
-            LIMIT 100
-        """)
-        rows = cursor.fetchall()
-        conn.close()
+        with connect(DB_FILE) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT user, file, db_name, timestamp
+                FROM upload_history
+                ORDER BY timestamp DESC
+                LIMIT 100
+            """)
+            rows = cursor.fetchall()
 
         history = [
             {
@@ -466,34 +674,6 @@ def get_upload_history():
         traceback.print_exc()
         return jsonify({"error": f"Failed to retrieve upload history: {str(e)}"}), 500
 
-# ---------------------- EXTRA: S3 list for DBAdmin.jsx ----------------------
-@admin_bp.route('/api/s3-db-pdfs', methods=['GET'])
-def s3_db_pdfs():
-    """
-    Returns a flat list of PDFs in the S3 bucket with presigned URLs:
-      { files: [ { Key, url } ] }
-    DBAdmin.jsx maps these to `${db}/${file}` to preview PDFs from the DB list.
-    """
-    try:
-        paginator = s3.get_paginator("list_objects_v2")
-        pages = paginator.paginate(Bucket=S3_BUCKET)
-        out = []
-        for page in pages:
-            for obj in page.get("Contents", []):
-                key = obj["Key"]
-                if key.endswith("/") or not key.lower().endswith(".pdf"):
-                    continue
-                url = s3.generate_presigned_url(
-                    "get_object",
-                    Params={"Bucket": S3_BUCKET, "Key": key},
-                    ExpiresIn=3600,
-                )
-                out.append({"Key": key, "url": url})
-        return jsonify({"files": out})
-    except Exception as e:
-        traceback.print_exc()
-        return jsonify({"files": [], "error": str(e)}), 500
-    
 @admin_bp.route('/api/upload-to-s3', methods=['POST'])
 def upload_to_s3():
     file = request.files.get('file')
@@ -507,6 +687,7 @@ def upload_to_s3():
         key, url = upload_pdf_to_s3(tmp_path, prefix, file.filename)
         if not key:
             return jsonify({'error': 'S3 upload failed'}), 500
+        s3_catalog.record_put(key)
         # optional: log this as an “upload” without DB indexing
         log_upload_history(request.form.get('user', 'guest'), file.filename, prefix or '(s3-only)')
         return jsonify({'message': '✅ Uploaded', 'key': key, 'url': url})
@@ -521,6 +702,7 @@ def delete_s3_file():
     if not key:
         return jsonify({'error': 'Missing key'}), 400
     s3.delete_object(Bucket=S3_BUCKET, Key=key)
+    s3_catalog.record_delete(key)
     return jsonify({'message': f'✅ Deleted {key}'})
 
 # --- add near your imports ---
@@ -541,28 +723,8 @@ def list_s3_pdfs():
         return ('', 204)
 
     try:
-        # list all objects (paginate if you have >1k keys)
-        resp = s3.list_objects_v2(Bucket=S3_BUCKET)
-        contents = resp.get('Contents', []) or []
-
-        files = []
-        for obj in contents:
-            key = obj['Key']
-            if key.lower().endswith('.pdf'):
-                url = s3.generate_presigned_url(
-                    'get_object',
-                    Params={'Bucket': S3_BUCKET, 'Key': key},
-                    ExpiresIn=3600
-                )
-                lm = obj.get('LastModified')
-                files.append({
-                    'Key': key,
-                    'url': url,
-                    'Size': obj.get('Size', 0),
-                    'LastModified': getattr(lm, 'isoformat', lambda: str(lm))()
-                })
-
-        return jsonify({'files': files})
+        # Cached, fully paginated listing; ?limit=&cursor=&prefix= for pages
+        return listing_response(S3_BUCKET, suffix='.pdf')
     except Exception as e:
         print('❌ list_s3_pdfs error:', e)
         return jsonify({'files': [], 'error': str(e)}), 500
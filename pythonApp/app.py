@@ -2,20 +2,30 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from datetime import datetime
-import sqlite3
+from db_pool import connect
+from history_writer import submit as submit_history, writer_for
+from work_orders import FUZZY_MAX_DISTANCE, WorkOrderIndex, ensure_wo_index, resolve_work_orders
 from ocr import extract_work_orders_from_image
 import os
+import threading
 import traceback
 from helpers import rank_documents, ask_gemini_single_file, get_quick_view_sentences
 from admin import admin_bp
+from jobs import jobs_bp
+from s3_catalog import s3_catalog_bp, listing_response, REPORTS_BUCKET
+from pdf_proxy import pdf_proxy_bp
+from thumbnails import thumbnails_bp
 from core_box_inventory import corebox_bp
-import boto3
 from reports_binder import reports_binder_bp
 
 app = Flask(__name__)
 app.register_blueprint(reports_binder_bp)
 app.register_blueprint(admin_bp)
 app.register_blueprint(corebox_bp)
+app.register_blueprint(jobs_bp)
+app.register_blueprint(s3_catalog_bp)
+app.register_blueprint(pdf_proxy_bp)
+app.register_blueprint(thumbnails_bp)
 CORS(app)
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
@@ -25,7 +35,7 @@ GEO_DB = os.path.join(BASE_DIR, "uploads", "reports.db")
 def init_db():
     if not os.path.exists(DB_FILE):
         os.makedirs(os.path.dirname(DB_FILE), exist_ok=True)
-        with sqlite3.connect(DB_FILE) as conn:
+        with connect(DB_FILE) as conn:
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS chat_history (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -66,7 +76,7 @@ def rank_only():
         ranked = rank_documents(query, GEO_DB, min_wo, max_wo, top_k=30)
 
         # ✅ Check if an identical ranking query was already cached
-        with sqlite3.connect(DB_FILE) as conn:
+        with connect(DB_FILE) as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT 1 FROM chat_history
@@ -75,18 +85,18 @@ def rank_only():
             """, (user, query))
             already_cached = cursor.fetchone()
 
-            if not already_cached:
-                conn.execute("""
-                    INSERT INTO chat_history (user, question, answer, sources, timestamp, db_name)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (
-                    user,
-                    query,
-                    "[Ranking Only - No answer]",
-                    ",".join(doc["file"] for doc in ranked),
-                    datetime.now().isoformat(),
-                    "reports.db"  # or pass the actual db name if variable
-                ))
+        if not already_cached:
+            submit_history(DB_FILE, """
+                INSERT INTO chat_history (user, question, answer, sources, timestamp, db_name)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (
+                user,
+                query,
+                "[Ranking Only - No answer]",
+                ",".join(doc["file"] for doc in ranked),
+                datetime.now().isoformat(),
+                "reports.db"  # or pass the actual db name if variable
+            ))
 
         return jsonify({
             "ranked_files": [
@@ -118,11 +128,10 @@ def answer_from_single_file():
         snippets = get_quick_view_sentences(file, query, GEO_DB)
         answer = ask_gemini_single_file(query, file, snippets)
 
-        with sqlite3.connect(DB_FILE) as conn:
-            conn.execute("""
-                INSERT INTO chat_history (user, question, answer, sources, timestamp)
-                VALUES (?, ?, ?, ?, ?)
-            """, (user, query, answer, file, datetime.now().isoformat()))
+        submit_history(DB_FILE, """
+            INSERT INTO chat_history (user, question, answer, sources, timestamp)
+            VALUES (?, ?, ?, ?, ?)
+        """, (user, query, answer, file, datetime.now().isoformat()))
 
 
         return jsonify({"answer": answer})  # ✅ Make sure this return always happens
@@ -142,7 +151,7 @@ def get_db_chat_history():
     user = request.args.get("user", "guest")
 
     try:
-        with sqlite3.connect(DB_FILE) as conn:  # Always use global DB_FILE
+        with connect(DB_FILE) as conn:  # Always use global DB_FILE
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT question, answer, sources, timestamp
@@ -200,7 +209,7 @@ def handle_question():
         snippets = get_quick_view_sentences(file, query, db_path)
 
         if use_cache:
-            with sqlite3.connect(DB_FILE) as conn:
+            with connect(DB_FILE) as conn:
                 cursor = conn.cursor()
                 cursor.execute("""SELECT answer FROM chat_history
                                   WHERE user = ? AND sources = ? AND LOWER(question) = LOWER(?)
@@ -212,11 +221,10 @@ def handle_question():
 
         answer = ask_gemini_single_file(query, file, snippets, user=user, use_cache=False, use_web=use_web)
 
-        with sqlite3.connect(DB_FILE) as conn:
-            conn.execute("""
-                INSERT INTO chat_history (user, question, answer, sources, timestamp, db_name)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (user, query, answer, file, datetime.now().isoformat(), db_name))
+        submit_history(DB_FILE, """
+            INSERT INTO chat_history (user, question, answer, sources, timestamp, db_name)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (user, query, answer, file, datetime.now().isoformat(), db_name))
 
         return jsonify({'answer': answer})
 
@@ -227,7 +235,7 @@ def handle_question():
 @app.route('/api/files', methods=['GET'])
 def list_files():
     try:
-        with sqlite3.connect(GEO_DB) as conn:
+        with connect(GEO_DB) as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT DISTINCT file FROM chunks")
             files = sorted(set(row[0] for row in cursor.fetchall()))
@@ -242,7 +250,7 @@ def get_chat_history():
     db = request.args.get('db', '')
 
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with connect(DB_FILE) as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT question, answer FROM chat_history
@@ -270,7 +278,7 @@ def delete_user():
         return jsonify({"error": "Cannot delete the Super Owner"}), 403
 
 
-    with sqlite3.connect(USER_DB) as conn:
+    with connect(USER_DB) as conn:
         conn.execute("DELETE FROM users WHERE email = ?", (email,))
         conn.commit()
 
@@ -287,7 +295,9 @@ def delete_history():
     if not all([user, db_name, question]):
         return jsonify({'error': 'Missing parameters'}), 400
 
-    with sqlite3.connect(DB_FILE) as conn:
+    # Let queued history rows land first so the delete sees them
+    writer_for(DB_FILE).flush()
+    with connect(DB_FILE) as conn:
         cursor = conn.cursor()
         cursor.execute("DELETE FROM chat_history WHERE user=? AND db_name=? AND question=?", (user, db_name, question))
         conn.commit()
@@ -331,116 +341,62 @@ def ocr_work_orders():
 
 @app.route('/api/s3-files')
 def list_s3_files():
+    """{ files: [ { Key, Size, LastModified, url } ], next_cursor }; optional ?limit=&cursor=&prefix="""
     try:
-        s3 = boto3.client('s3')
-        BUCKET_NAME = 'geolabs-reports'
-        response = s3.list_objects_v2(Bucket=BUCKET_NAME)
-
-        files = []
-        for obj in response.get('Contents', []):
-            key = obj['Key']
-            # ✅ generate temporary signed URL for downloading
-            url = s3.generate_presigned_url(
-                'get_object',
-                Params={'Bucket': BUCKET_NAME, 'Key': key},
-                ExpiresIn=3600  # valid for 1 hour
-            )
-            files.append({
-                'Key': key,
-                'url': url
-            })
-
-        return jsonify({'files': files})
+        return listing_response(REPORTS_BUCKET)
     except Exception as e:
         print('❌ S3 List Error:', e)
         return jsonify({'error': str(e)}), 500
 
 
 PR_DB = os.path.join(BASE_DIR, "uploads", "pr_data.db")
-TABLE_NAME = "pr_data"
+wo_index = WorkOrderIndex(PR_DB)
+
+def init_pr_index():
+    if not os.path.exists(PR_DB):
+        return
+    try:
+        with connect(PR_DB) as conn:
+            ensure_wo_index(conn)
+        wo_index.refresh()
+        threading.Thread(target=wo_index.build_fuzzy, name="wo-fuzzy-index", daemon=True).start()
+    except Exception as e:
+        print("⚠️ Could not index pr_data work orders:", e)
 
 @app.route("/api/lookup-work-orders", methods=["POST"])
 def lookup_work_orders():
     data = request.get_json()
     work_orders = data.get("work_orders", [])
+    fuzzy = bool(data.get("fuzzy", False))
+
+    if fuzzy:
+        try:
+            max_distance = int(data.get("max_distance", 1))
+            max_candidates = int(data.get("max_candidates", 3))
+        except (TypeError, ValueError):
+            return jsonify({"error": "max_distance and max_candidates must be integers."}), 400
+        if not 0 <= max_distance <= FUZZY_MAX_DISTANCE:
+            return jsonify({"error": f"max_distance must be between 0 and {FUZZY_MAX_DISTANCE}."}), 400
+        if max_candidates < 1:
+            return jsonify({"error": "max_candidates must be at least 1."}), 400
 
     try:
-        conn = sqlite3.connect(PR_DB)
-        cursor = conn.cursor()
-        result = []
-
-        for wo in work_orders:
-            original_wo = wo.strip()
-            formatted_wo = None
-            base_wo = original_wo
-
-            # Normalize like 8482-00A -> 8482-00(A)
-            if len(original_wo) >= 3 and original_wo[-1].isalpha():
-                base = original_wo[:-1]
-                letter = original_wo[-1]
-                formatted_wo = f"{base}({letter})"
-            elif '-' not in original_wo and len(original_wo) == 4:
-                # For 4-digit WOs like '8210', try to find the lowest matching '8210-XX'
-                cursor.execute(f"""
-                    SELECT WO, Client, Project, PR, Date
-                    FROM {TABLE_NAME}
-                    WHERE WO LIKE ? COLLATE NOCASE
-                    ORDER BY WO ASC
-                """, (f"{original_wo}-%",))
-                row = cursor.fetchone()
-                if row:
-                    result.append({
-                        "work_order": original_wo,
-                        "project_wo": row[0],
-                        "client": row[1],
-                        "project": row[2],
-                        "pr": row[3],
-                        "date": row[4]
-                    })
-                    continue  # Skip remaining steps
-
-            if formatted_wo:
-                print(f"🔍 Trying formatted WO: '{formatted_wo}'")
-                cursor.execute(f"""
-                    SELECT WO, Client, Project, PR, Date
-                    FROM {TABLE_NAME}
-                    WHERE WO LIKE ? COLLATE NOCASE
-                    LIMIT 1
-                """, (f"{formatted_wo}%",))
-                row = cursor.fetchone()
-            else:
-                print(f"🔍 Trying original WO: '{original_wo}'")
-                cursor.execute(f"""
-                    SELECT WO, Client, Project, PR, Date
-                    FROM {TABLE_NAME}
-                    WHERE WO LIKE ? COLLATE NOCASE
-                    LIMIT 1
-                """, (f"{original_wo}%",))
-                row = cursor.fetchone()
-
-            if row:
-                result.append({
-                    "work_order": original_wo,
-                    "project_wo": row[0],
-                    "client": row[1],
-                    "project": row[2],
-                    "pr": row[3],
-                    "date": row[4]
-                })
+        try:
+            if fuzzy:
+                result = wo_index.resolve_fuzzy(
+                    work_orders,
+                    max_distance=max_distance,
+                    limit=max_candidates,
+                )
             else:
-                result.append({
-                    "work_order": original_wo,
-                    "project_wo": "Not Found",
-                    "client": "Not Found",
-                    "project": "Not Found",
-                    "pr": "Not Found",
-                    "date": "Not Found"
-                })
-
-
-
-
-        conn.close()
+                result = wo_index.resolve(work_orders)
+        except Exception as e:
+            # In-memory index unavailable (e.g. pr_data missing at load) -> batched SQL
+            print("⚠️ Work-order index unavailable, using SQL:", e)
+            with connect(PR_DB) as conn:
+                result = resolve_work_orders(conn, work_orders)
+
+        print(f"🔍 Resolved {sum(r['project_wo'] != 'Not Found' for r in result)}/{len(result)} work orders")
         return jsonify({"matches": result})
 
     except Exception as e:
@@ -448,36 +404,15 @@ def lookup_work_orders():
         return jsonify({"error": str(e)}), 500
     
 
-@app.route('/api/s3-db-pdfs')
-def list_s3_db_pdfs():
-    try:
-        s3 = boto3.client('s3')
-        BUCKET_NAME = 'geolabs-db-pdfs'
-        response = s3.list_objects_v2(Bucket=BUCKET_NAME)
-
-        files = []
-        for obj in response.get('Contents', []):
-            key = obj['Key']
-            url = s3.generate_presigned_url(
-                'get_object',
-                Params={'Bucket': BUCKET_NAME, 'Key': key},
-                ExpiresIn=3600  # 1 hour
-            )
-            files.append({
-                'Key': key,
-                'url': url
-            })
-
-        return jsonify({'files': files})
-    except Exception as e:
-        print('❌ S3 DB PDF List Error:', e)
-        return jsonify({'error': str(e)}), 500
+@app.route("/api/work-order-index/stats", methods=["GET"])
+def work_order_index_stats():
+    return jsonify(wo_index.stats())
 
 USER_DB = os.path.join(BASE_DIR, "uploads", "users.db")
 
 def init_users_db():
     os.makedirs(os.path.dirname(USER_DB), exist_ok=True)
-    with sqlite3.connect(USER_DB) as conn:
+    with connect(USER_DB) as conn:
         conn.execute("""
             CREATE TABLE IF NOT EXISTS users (
                 email TEXT PRIMARY KEY,
@@ -494,7 +429,7 @@ def register_user():
     if not email:
         return jsonify({"error": "Missing email"}), 400
 
-    with sqlite3.connect(USER_DB) as conn:
+    with connect(USER_DB) as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM users WHERE email = ?", (email,))
         if cursor.fetchone() is None:
@@ -506,7 +441,7 @@ def register_user():
 
 @app.route("/api/users", methods=["GET"])
 def get_users():
-    with sqlite3.connect(USER_DB) as conn:
+    with connect(USER_DB) as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT email, role FROM users")
         rows = cursor.fetchall()
@@ -523,7 +458,7 @@ def update_role():
     if not email or not role:
         return jsonify({"error": "Missing email or role"}), 400
 
-    with sqlite3.connect(USER_DB) as conn:
+    with connect(USER_DB) as conn:
         conn.execute("UPDATE users SET role = ? WHERE email = ?", (role, email))
         conn.commit()
 
@@ -535,6 +470,7 @@ def update_role():
 print("🔧 Starting app...")
 init_db()
 init_users_db()
+init_pr_index()
 print("✅ Ready to run Flask")
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,86 @@
+# chunking.py
+from collections import deque
+
+from nltk.tokenize.punkt import PunktSentenceTokenizer, PunktParameters
+
+CHUNK_SIZE = 800
+OVERLAP = 200
+
+punkt_param = PunktParameters()
+punkt_tokenizer = PunktSentenceTokenizer(punkt_param)
+
+def safe_sent_tokenize(text):
+    return punkt_tokenizer.tokenize(text)
+
+def word_count(text):
+    return len(text.split())
+
+def _split_long(sentence, limit, length):
+    """Break a single sentence longer than `limit` into word runs that fit."""
+    pieces, current, total = [], [], 0
+    for word in sentence.split():
+        n = length(word)
+        if current and total + n > limit:
+            pieces.append(' '.join(current))
+            current, total = [], 0
+        current.append(word)
+        total += n
+    if current:
+        pieces.append(' '.join(current))
+    return pieces
+
+def _trim_to_overlap(window, sizes, total, overlap):
+    """Drop sentences from the left, keeping the shortest tail that covers `overlap`; returns the new total."""
+    keep, kept = 0, 0
+    for n in reversed(sizes):
+        keep += 1
+        kept += n
+        if kept >= overlap:
+            break
+    for _ in range(len(window) - keep):
+        window.popleft()
+        total -= sizes.popleft()
+    return total
+
+def iter_chunks(sentences, chunk_size=CHUNK_SIZE, overlap=OVERLAP, length=word_count, hard_limit=False):
+    """
+    Sliding sentence window in one pass: a running total plus a deque of per-sentence
+    lengths, so each sentence is measured once and trimmed from the left once.
+    Consumes `sentences` lazily and yields (chunk_text, size) as soon as each chunk closes.
+
+    length:     size of a string (words by default; pass a tokenizer counter for tokens)
+    hard_limit: False -> emit once the window reaches chunk_size (legacy behaviour, chunks
+                may overshoot by one sentence); True -> chunk_size is a ceiling, overlong
+                sentences are split, so no chunk exceeds it (e.g. a model's token window)
+    """
+    window, sizes = deque(), deque()
+    total = 0
+
+    for sentence in sentences:
+        n = length(sentence)
+        if hard_limit and n > chunk_size:
+            pieces = [(p, length(p)) for p in _split_long(sentence, chunk_size, length)]
+        else:
+            pieces = [(sentence, n)]
+        for piece, n in pieces:
+            if hard_limit and window and total + n > chunk_size:
+                yield ' '.join(window), total
+                total = _trim_to_overlap(window, sizes, total, overlap)
+                while window and total + n > chunk_size:
+                    window.popleft()
+                    total -= sizes.popleft()
+            window.append(piece)
+            sizes.append(n)
+            total += n
+            if not hard_limit and total >= chunk_size:
+                yield ' '.join(window), total
+                total = _trim_to_overlap(window, sizes, total, overlap)
+    if window:
+        yield ' '.join(window), total
+
+def chunk_sentences(sentences, chunk_size=CHUNK_SIZE, overlap=OVERLAP, length=word_count, hard_limit=False):
+    """List form of iter_chunks(): [(chunk_text, size), ...]."""
+    return list(iter_chunks(sentences, chunk_size, overlap, length, hard_limit))
+
+def chunk_text(text, chunk_size=CHUNK_SIZE, overlap=OVERLAP, length=word_count, hard_limit=False):
+    return [c for c, _ in chunk_sentences(safe_sent_tokenize(text), chunk_size, overlap, length, hard_limit)]
@@ -1,41 +1,47 @@
 # server/blueprints/core_box_inventory.py
 import os
+import io
+import csv
 import json
+import base64
 import sqlite3
-from datetime import datetime
+import threading
+from collections import OrderedDict
+from datetime import datetime, date
 from flask import Blueprint, request, jsonify, current_app
+from db_pool import connect
 
 corebox_bp = Blueprint("corebox", __name__)
-# --- ensure schema once per process ----------------------------
-_SCHEMA_READY = False
-
-@corebox_bp.before_app_request
-def _ensure_core_schema_once():
-    """Create tables/indexes if missing (runs once per process)."""
-    global _SCHEMA_READY
-    if _SCHEMA_READY:
-        return
+
+# --- resolve path + ensure schema once per app, at registration ---------------
+@corebox_bp.record
+def _on_register(setup_state):
+    """Runs when app.register_blueprint(corebox_bp) is called; requests just read the cached path."""
+    app = setup_state.app
+    db_path = resolve_db_path(app)
+    app.extensions["corebox_db_path"] = db_path
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
     try:
-        with core_conn() as conn:
+        with connect(db_path, row_factory=sqlite3.Row) as conn:
             ensure_core_tables(conn)  # <- creates core_boxes & core_boxes_changes if missing
-        _SCHEMA_READY = True
         print("✅ core_box_inventory: schema ready")
     except Exception as e:
         print("❌ core_box_inventory: schema init failed:", e)
 
 # --- PATH RESOLUTION ---------------------------------------------------------
-def resolve_db_path():
+def resolve_db_path(app=None):
     """
     Order of precedence:
-    1) current_app.config['CORE_DB_PATH'] if present
+    1) app.config['CORE_DB_PATH'] if present
     2) server/uploads/core_box_inventory.db
     3) <project_root>/uploads/core_box_inventory.db  (one level up from server/)
     """
-    if current_app and current_app.config.get("CORE_DB_PATH"):
-        return os.path.abspath(current_app.config["CORE_DB_PATH"])
+    app = app or current_app
+    if app and app.config.get("CORE_DB_PATH"):
+        return os.path.abspath(app.config["CORE_DB_PATH"])
 
     # server package root
-    server_root = current_app.root_path if current_app else os.path.abspath(
+    server_root = app.root_path if app else os.path.abspath(
         os.path.join(os.path.dirname(__file__), "..")
     )
 
@@ -49,12 +55,12 @@ def resolve_db_path():
     # fall back to first candidate even if it doesn't exist (so debug shows it)
     return candidates[0]
 
+def core_db_path():
+    """Path resolved at registration (falls back to resolving now outside a registered app)."""
+    return current_app.extensions.get("corebox_db_path") or resolve_db_path()
+
 def core_conn():
-    db_path = resolve_db_path()
-    os.makedirs(os.path.dirname(db_path), exist_ok=True)
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return connect(core_db_path(), row_factory=sqlite3.Row)
 
 # --- schema helpers -------------------------------------------------
 def ensure_core_tables(conn):
@@ -88,46 +94,62 @@ def ensure_core_tables(conn):
     CREATE INDEX IF NOT EXISTS idx_core_wo     ON core_boxes(work_order);
     CREATE INDEX IF NOT EXISTS idx_core_sub    ON core_boxes(report_submission_date);
     CREATE INDEX IF NOT EXISTS idx_core_exp    ON core_boxes(storage_expiry_date);
+    CREATE INDEX IF NOT EXISTS idx_core_project  ON core_boxes(project);
+    CREATE INDEX IF NOT EXISTS idx_core_engineer ON core_boxes(engineer);
+
+    -- bumped by every write to core_boxes (web, bulk, importer scripts); keys the count cache
+    CREATE TABLE IF NOT EXISTS core_boxes_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO core_boxes_version (id, version) VALUES (1, 0);
+    CREATE TRIGGER IF NOT EXISTS trg_core_boxes_ver_ins AFTER INSERT ON core_boxes
+    BEGIN UPDATE core_boxes_version SET version = version + 1 WHERE id = 1; END;
+    CREATE TRIGGER IF NOT EXISTS trg_core_boxes_ver_upd AFTER UPDATE ON core_boxes
+    BEGIN UPDATE core_boxes_version SET version = version + 1 WHERE id = 1; END;
+    CREATE TRIGGER IF NOT EXISTS trg_core_boxes_ver_del AFTER DELETE ON core_boxes
+    BEGIN UPDATE core_boxes_version SET version = version + 1 WHERE id = 1; END;
     """)
+    try:
+        # importer-built DBs already have it; lets bulk upserts rely on one row per W.O.
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS uq_core_work_order ON core_boxes(work_order)")
+    except sqlite3.IntegrityError as e:
+        print("⚠️ core_box_inventory: duplicate work orders, unique index not created:", e)
+    ensure_core_fts(conn)
 
-# --- SCHEMA/INDICES ----------------------------------------------------------
-def init_corebox_schema_and_indices():
-    with core_conn() as conn:
-        conn.executescript("""
-        CREATE TABLE IF NOT EXISTS core_boxes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            year INTEGER,
-            island TEXT,
-            work_order TEXT,
-            project TEXT,
-            engineer TEXT,
-            report_submission_date TEXT,
-            storage_expiry_date TEXT,
-            complete TEXT,
-            keep_or_dump TEXT
-        );
-                           
-
-        CREATE TABLE IF NOT EXISTS core_boxes_changes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            action TEXT,
-            core_box_id INTEGER,
-            work_order TEXT,
-            user TEXT,
-            ts TEXT,
-            old_snapshot TEXT,
-            new_snapshot TEXT
-        );
-
-        CREATE INDEX IF NOT EXISTS idx_core_year   ON core_boxes(year);
-        CREATE INDEX IF NOT EXISTS idx_core_island ON core_boxes(island);
-        CREATE INDEX IF NOT EXISTS idx_core_wo     ON core_boxes(work_order);
-        CREATE INDEX IF NOT EXISTS idx_core_sub    ON core_boxes(report_submission_date);
-        CREATE INDEX IF NOT EXISTS idx_core_exp    ON core_boxes(storage_expiry_date);
-        """)
-# call once at import (safe if table exists)
-# (You can also call this from app factory after you set config path.)
-# init_corebox_schema_and_indices()
+def ensure_core_fts(conn):
+    """
+    Trigram FTS5 index over work_order/project/engineer (external content, rowid = core_boxes.id).
+    Triggers keep it in sync with every write; built from existing rows the first time.
+    """
+    existed = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'core_boxes_fts'"
+    ).fetchone()
+    conn.executescript("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS core_boxes_fts USING fts5(
+        work_order, project, engineer,
+        content='core_boxes', content_rowid='id', tokenize='trigram'
+    );
+    CREATE TRIGGER IF NOT EXISTS trg_core_boxes_fts_ins AFTER INSERT ON core_boxes BEGIN
+        INSERT INTO core_boxes_fts(rowid, work_order, project, engineer)
+        VALUES (new.id, new.work_order, new.project, new.engineer);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_core_boxes_fts_del AFTER DELETE ON core_boxes BEGIN
+        INSERT INTO core_boxes_fts(core_boxes_fts, rowid, work_order, project, engineer)
+        VALUES ('delete', old.id, old.work_order, old.project, old.engineer);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_core_boxes_fts_upd AFTER UPDATE OF work_order, project, engineer ON core_boxes BEGIN
+        INSERT INTO core_boxes_fts(core_boxes_fts, rowid, work_order, project, engineer)
+        VALUES ('delete', old.id, old.work_order, old.project, old.engineer);
+        INSERT INTO core_boxes_fts(rowid, work_order, project, engineer)
+        VALUES (new.id, new.work_order, new.project, new.engineer);
+    END;
+    """)
+    if not existed:
+        # W.O. hits outrank project hits, which outrank engineer hits
+        conn.execute("INSERT INTO core_boxes_fts(core_boxes_fts, rank) VALUES ('rank', 'bm25(10.0, 4.0, 1.0)')")
+        conn.execute("INSERT INTO core_boxes_fts(core_boxes_fts) VALUES ('rebuild')")
+        print("✅ core_box_inventory: search index built")
 
 # --- UTIL --------------------------------------------------------------------
 def safe_dt(s):
@@ -146,10 +168,97 @@ def compute_year(report_iso, expiry_iso):
     if expiry_iso: return int(expiry_iso[:4])
     return None
 
+# --- PAGING ------------------------------------------------------------------
+LIST_COLUMNS = """id, year, island, work_order, project, engineer,
+             report_submission_date, storage_expiry_date, complete, keep_or_dump"""
+COUNT_CACHE_MAX = 256
+_count_cache = OrderedDict()   # (data version, where, params, day) -> total
+_count_lock = threading.Lock()
+
+def encode_cursor(value, row_id):
+    raw = json.dumps([value, row_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(token):
+    """(sort value, id) from a next_cursor token; raises ValueError if it isn't one."""
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        return value, int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def cached_count(conn, where_sql, params, expired=False):
+    """COUNT(*) for a filter, reused until core_boxes changes (version bumped by triggers)."""
+    version = conn.execute("SELECT version FROM core_boxes_version WHERE id = 1").fetchone()["version"]
+    key = (version, where_sql, tuple(params), date.today().isoformat() if expired else None)
+    with _count_lock:
+        if key in _count_cache:
+            _count_cache.move_to_end(key)
+            return _count_cache[key]
+    total = conn.execute(f"SELECT COUNT(*) AS n FROM core_boxes {where_sql}", params).fetchone()["n"]
+    with _count_lock:
+        _count_cache[key] = total
+        while len(_count_cache) > COUNT_CACHE_MAX:
+            _count_cache.popitem(last=False)
+    return total
+
+def keyset_page(conn, where, params, sort_by, sort_dir, cursor, limit):
+    """
+    Rows after `cursor` in ORDER BY sort_by, id (same direction), without OFFSET.
+    SQLite puts NULLs first ascending and last descending, so the NULL and non-NULL
+    runs are read as separate segments, each a plain index range seek.
+    """
+    op = ">" if sort_dir == "ASC" else "<"
+    segments = ("null", "value") if sort_dir == "ASC" else ("value", "null")
+    if cursor is not None:
+        segments = segments[segments.index("null" if cursor[0] is None else "value"):]
+
+    rows = []
+    for seg in segments:
+        w, p = list(where), list(params)
+        in_cursor_segment = cursor is not None and (cursor[0] is None) == (seg == "null")
+        if seg == "value":
+            w.append(f"{sort_by} IS NOT NULL")
+            if in_cursor_segment:
+                w.append(f"({sort_by}, id) {op} (?, ?)")
+                p += [cursor[0], cursor[1]]
+            order = f"{sort_by} {sort_dir}, id {sort_dir}"
+        else:
+            w.append(f"{sort_by} IS NULL")
+            if in_cursor_segment:
+                w.append(f"id {op} ?")
+                p.append(cursor[1])
+            order = f"id {sort_dir}"
+        rows += conn.execute(f"""
+          SELECT {LIST_COLUMNS}
+          FROM core_boxes
+          WHERE {' AND '.join(w)}
+          ORDER BY {order}
+          LIMIT ?
+        """, p + [limit - len(rows)]).fetchall()
+        if len(rows) >= limit:
+            break
+    return rows
+
+# --- SEARCH ------------------------------------------------------------------
+FTS_MIN_TERM = 3   # trigram tokens: shorter terms can't use the index
+
+def search_filter(q):
+    """
+    (where clauses, params, match expr or None) for the free-text box. The whole string must
+    appear somewhere in W.O./project/engineer as a substring, same as the old LIKE '%q%';
+    3+ chars go through core_boxes_fts as one phrase, shorter ones fall back to LIKE.
+    """
+    if len(q) < FTS_MIN_TERM:
+        like = f"%{q}%"
+        return ["(work_order LIKE ? OR project LIKE ? OR engineer LIKE ?)"], [like, like, like], None
+    match = '"' + q.replace('"', '""') + '"'
+    return ["id IN (SELECT rowid FROM core_boxes_fts WHERE core_boxes_fts MATCH ?)"], [match], match
+
 # --- DEBUG -------------------------------------------------------------------
 @corebox_bp.get("/api/core-boxes/_debug")
 def core_debug():
-    path = resolve_db_path()
+    path = core_db_path()
     exists = os.path.exists(path)
     cnt = 0
     try:
@@ -175,18 +284,25 @@ def api_core_boxes():
     page = max(1, int(request.args.get("page", 1)))
     page_size = max(1, min(200, int(request.args.get("page_size", 25))))
     offset = (page - 1) * page_size
+    cursor = request.args.get("cursor", "").strip()
+    try:
+        cursor = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return {"error": str(e)}, 400
 
     SORTABLE = {
         "year","island","work_order","project","engineer",
         "report_submission_date","storage_expiry_date"
     }
+    match = None
+    where, params = [], []
+    if q:
+        where, params, match = search_filter(q)
+    # sort_by=relevance: best FTS matches first (only meaningful with q)
+    relevance = sort_by == "relevance" and match is not None
     if sort_by not in SORTABLE: sort_by = "report_submission_date"
     if sort_dir not in ("ASC","DESC"): sort_dir = "DESC"
 
-    where, params = [], []
-    if q:
-        where.append("(work_order LIKE ? OR project LIKE ? OR engineer LIKE ?)")
-        like = f"%{q}%"; params += [like, like, like]
     if island:
         where.append("island = ?"); params.append(island)
     if year:
@@ -199,21 +315,36 @@ def api_core_boxes():
         where.append("date(storage_expiry_date) < date('now')")
 
     where_sql = f"WHERE {' AND '.join(where)}" if where else ""
-    sql_data = f"""
-      SELECT id, year, island, work_order, project, engineer,
-             report_submission_date, storage_expiry_date, complete, keep_or_dump
-      FROM core_boxes
-      {where_sql}
-      ORDER BY {sort_by} {sort_dir}
-      LIMIT ? OFFSET ?
-    """
-    sql_count = f"SELECT COUNT(*) AS n FROM core_boxes {where_sql}"
 
     with core_conn() as conn:
-        total = conn.execute(sql_count, params).fetchone()["n"]
-        rows = conn.execute(sql_data, params + [page_size, offset]).fetchall()
+        total = cached_count(conn, where_sql, params, expired)
+        if relevance:
+            rows = conn.execute(f"""
+              SELECT {LIST_COLUMNS}
+              FROM core_boxes
+              JOIN (SELECT rowid AS hit_id, rank AS hit_rank
+                    FROM core_boxes_fts WHERE core_boxes_fts MATCH ?) ON hit_id = id
+              {where_sql}
+              ORDER BY hit_rank, id
+              LIMIT ? OFFSET ?
+            """, [match] + params + [page_size, offset]).fetchall()
+        elif cursor is not None or page == 1:
+            # Seek pagination: pass back next_cursor to get the following page
+            rows = keyset_page(conn, where, params, sort_by, sort_dir, cursor, page_size)
+        else:
+            # Jumping straight to page N still needs OFFSET (same order as the keyset pages)
+            rows = conn.execute(f"""
+              SELECT {LIST_COLUMNS}
+              FROM core_boxes
+              {where_sql}
+              ORDER BY {sort_by} {sort_dir}, id {sort_dir}
+              LIMIT ? OFFSET ?
+            """, params + [page_size, offset]).fetchall()
         out = [dict(r) for r in rows]
-    return {"rows": out, "total": total}
+    next_cursor = None
+    if len(out) == page_size and not relevance:
+        next_cursor = encode_cursor(out[-1][sort_by], out[-1]["id"])
+    return {"rows": out, "total": total, "next_cursor": next_cursor}
 
 @corebox_bp.get("/api/core-boxes/years")
 def api_core_years():
@@ -391,6 +522,161 @@ def restore_core_box():
         """, (new_id, snap["work_order"], "web", datetime.utcnow().isoformat(), json.dumps(ins)))
     return {"status": "restored", "id": new_id}
 
+# --- BULK IMPORT / UPDATE ----------------------------------------------------
+CORE_FIELDS = [
+    "year","island","work_order","project","engineer",
+    "report_submission_date","storage_expiry_date","complete","keep_or_dump"
+]
+BULK_MAX_ROWS = int(os.environ.get("CORE_BULK_MAX_ROWS", "5000"))
+IN_CHUNK = 500   # keep IN (...) lists under SQLite's variable limit
+
+def read_bulk_rows():
+    """Rows from a JSON body ([...] or {"rows": [...]}), a text/csv body, or an uploaded CSV `file`."""
+    upload = request.files.get("file")
+    if upload or request.mimetype in ("text/csv", "application/csv"):
+        text = (upload.read() if upload else request.get_data()).decode("utf-8-sig")
+        reader = csv.DictReader(io.StringIO(text))
+        # blank cells mean "leave as is" (send "" in JSON to clear a field)
+        return [{(k or "").strip().lower().replace(" ", "_"): v for k, v in r.items() if k and isinstance(v, str) and v.strip()}
+                for r in reader]
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get("rows")
+    if not isinstance(data, list):
+        raise ValueError("Expected a JSON list of rows, {\"rows\": [...]}, or CSV")
+    return data
+
+def normalize_core_row(data, old=None):
+    """
+    Same rules as create/update: dates via safe_dt, expiry defaults to report + 3 months,
+    year from the dates unless given. Fields missing from `data` keep `old`'s values.
+    Raises ValueError for rows that can't be saved.
+    """
+    from dateutil.relativedelta import relativedelta
+    def pick(k):
+        if k in data and data[k] is not None:
+            return data[k]
+        return old[k] if old is not None else None
+
+    wo = str(pick("work_order") or "").strip()
+    if not wo:
+        raise ValueError("work_order is required")
+
+    dates = {}
+    for k in ("report_submission_date", "storage_expiry_date"):
+        raw = pick(k)
+        dates[k] = safe_dt(raw)
+        if str(raw or "").strip() and not dates[k]:
+            raise ValueError(f"{k}: unrecognized date {raw!r}")
+    report, expiry = dates["report_submission_date"], dates["storage_expiry_date"]
+    if not expiry and report:
+        expiry = (datetime.fromisoformat(report) + relativedelta(months=3)).date().isoformat()
+
+    year = pick("year")
+    if str(year or "").strip():
+        try:
+            year = int(float(year))
+        except (TypeError, ValueError):
+            raise ValueError(f"year: not a number {year!r}")
+    else:
+        year = compute_year(report, expiry)
+
+    def text(k):
+        return str(pick(k) or "").strip() or None
+
+    return {
+        "year": year,
+        "island": text("island"),
+        "work_order": wo,
+        "project": text("project"),
+        "engineer": text("engineer"),
+        "report_submission_date": report or None,
+        "storage_expiry_date": expiry or None,
+        "complete": text("complete"),
+        "keep_or_dump": text("keep_or_dump"),
+    }
+
+def existing_by_work_order(conn, work_orders):
+    found = {}
+    for i in range(0, len(work_orders), IN_CHUNK):
+        part = work_orders[i:i + IN_CHUNK]
+        marks = ",".join("?" * len(part))
+        for r in conn.execute(f"SELECT * FROM core_boxes WHERE work_order IN ({marks})", part):
+            found[r["work_order"]] = r
+    return found
+
+@corebox_bp.post("/api/core-boxes/bulk")
+def bulk_core_boxes():
+    """
+    POST /api/core-boxes/bulk   JSON [{work_order, ...}, ...] | {"rows": [...]} | CSV (body or `file`)
+    Creates rows whose work_order is new and updates the rest (only the fields given),
+    all in one transaction with one audit row per change. Bad rows are reported and skipped.
+    -> {"results": [{row, work_order, status: created|updated|unchanged|error, id?, error?}], counts...}
+    """
+    user = (request.headers.get("X-User") or request.args.get("user") or "bulk").strip()
+    try:
+        raw_rows = read_bulk_rows()
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return {"error": str(e)}, 400
+    if len(raw_rows) > BULK_MAX_ROWS:
+        return {"error": f"Too many rows ({len(raw_rows)}); max {BULK_MAX_ROWS} per request"}, 413
+
+    results = [{"row": i} for i in range(len(raw_rows))]
+    wanted, seen = [], {}
+    for res, data in zip(results, raw_rows):
+        wo = str((data or {}).get("work_order") or "").strip() if isinstance(data, dict) else ""
+        res["work_order"] = wo or None
+        if not isinstance(data, dict):
+            res.update(status="error", error="row must be an object")
+        elif not wo:
+            res.update(status="error", error="work_order is required")
+        elif wo in seen:
+            res.update(status="error", error=f"duplicate work_order in batch (row {seen[wo]})")
+        else:
+            seen[wo] = res["row"]
+            wanted.append((res, data))
+
+    ts = datetime.utcnow().isoformat()
+    inserts, updates, audits = [], [], []
+    with core_conn() as conn:
+        existing = existing_by_work_order(conn, [res["work_order"] for res, _ in wanted])
+        for res, data in wanted:
+            old = existing.get(res["work_order"])
+            try:
+                row = normalize_core_row(data, old)
+            except ValueError as e:
+                res.update(status="error", error=str(e))
+                continue
+            if old is None:
+                inserts.append((res, row))
+            elif any(row[k] != old[k] for k in CORE_FIELDS):
+                updates.append({**row, "id": old["id"]})
+                audits.append(("update", old["id"], row["work_order"], user, ts, json.dumps(dict(old)), json.dumps(row)))
+                res.update(status="updated", id=old["id"])
+            else:
+                res.update(status="unchanged", id=old["id"])
+
+        cols = ",".join(CORE_FIELDS)
+        conn.executemany(
+            f"INSERT INTO core_boxes ({cols}) VALUES ({','.join(':' + k for k in CORE_FIELDS)})",
+            [row for _, row in inserts])
+        conn.executemany(
+            f"UPDATE core_boxes SET {', '.join(f'{k}=:{k}' for k in CORE_FIELDS)} WHERE id=:id",
+            updates)
+        new_ids = {wo: r["id"] for wo, r in existing_by_work_order(
+            conn, [row["work_order"] for _, row in inserts]).items()}
+        for res, row in inserts:
+            res.update(status="created", id=new_ids[row["work_order"]])
+            audits.append(("create", res["id"], row["work_order"], user, ts, None, json.dumps(row)))
+        conn.executemany("""
+            INSERT INTO core_boxes_changes (action, core_box_id, work_order, user, ts, old_snapshot, new_snapshot)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, audits)
+
+    counts = {k: sum(r["status"] == k for r in results) for k in ("created", "updated", "unchanged", "error")}
+    print(f"📦 core-boxes bulk by {user}: {counts}")
+    return {"results": results, **counts}
+
 @corebox_bp.get("/api/core-boxes/changes")
 def get_core_changes():
     limit = max(1, min(500, int(request.args.get("limit", 100))))
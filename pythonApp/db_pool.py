@@ -0,0 +1,166 @@
+# db_pool.py
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# ---------------------- CONFIG ----------------------
+# Idle connections kept per DB file once a request hands them back.
+POOL_MAX_IDLE = int(os.environ.get("SQLITE_POOL_MAX_IDLE", "8"))
+BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+CACHE_SIZE_KIB = int(os.environ.get("SQLITE_CACHE_SIZE_KIB", "16384"))        # 16 MB page cache per connection
+MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))  # 256 MB memory-mapped reads
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",        # readers no longer block the writer (and vice versa)
+    "PRAGMA synchronous=NORMAL",      # safe with WAL, fsync only at checkpoints
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",
+    f"PRAGMA cache_size=-{CACHE_SIZE_KIB}",
+    f"PRAGMA mmap_size={MMAP_SIZE}",
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+class ConnectionPool:
+    """
+    Shared SQLite connection manager used by every blueprint.
+
+    A connection is owned by exactly one thread while checked out; nested
+    checkouts of the same DB file on the same thread reuse that connection.
+    When the outermost block exits the connection goes back to a per-file
+    idle list so the next request (on any thread) skips connect + PRAGMAs.
+    """
+
+    def __init__(self, max_idle=POOL_MAX_IDLE):
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._idle = {}         # path -> [conn, ...]
+        self._generation = {}   # path -> int, bumped by discard()
+        self._stats = {}        # path -> counters
+
+    # ---------------------- internals ----------------------
+    def _counters(self, key):
+        return self._stats.setdefault(key, {"opened": 0, "reused": 0, "closed": 0, "in_use": 0})
+
+    def _held(self):
+        held = getattr(self._local, "held", None)
+        if held is None:
+            held = self._local.held = {}
+        return held
+
+    def _open(self, key):
+        os.makedirs(os.path.dirname(key), exist_ok=True)
+        conn = sqlite3.connect(key, check_same_thread=False, timeout=BUSY_TIMEOUT_MS / 1000)
+        for pragma in PRAGMAS:
+            try:
+                conn.execute(pragma)
+            except sqlite3.DatabaseError as e:
+                print(f"⚠️ {pragma} failed on {os.path.basename(key)}: {e}")
+        return conn
+
+    def _checkout(self, key):
+        with self._lock:
+            gen = self._generation.get(key, 0)
+            counters = self._counters(key)
+            idle = self._idle.get(key)
+            conn = idle.pop() if idle else None
+            counters["in_use"] += 1
+            if conn is not None:
+                counters["reused"] += 1
+        if conn is None:
+            try:
+                conn = self._open(key)
+            except Exception:
+                with self._lock:
+                    counters["in_use"] -= 1
+                raise
+            with self._lock:
+                counters["opened"] += 1
+        return conn, gen
+
+    def _checkin(self, key, conn, gen):
+        if conn.in_transaction:
+            conn.rollback()
+        conn.row_factory = None
+        with self._lock:
+            counters = self._counters(key)
+            counters["in_use"] -= 1
+            idle = self._idle.setdefault(key, [])
+            if gen == self._generation.get(key, 0) and len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+            counters["closed"] += 1
+        conn.close()
+
+    # ---------------------- public API ----------------------
+    @contextmanager
+    def connection(self, db_path, row_factory=None):
+        """
+        with pool.connection(path) as conn: ...
+        Commits on success and rolls back on error, like `with sqlite3.connect(...)`.
+        """
+        key = os.path.abspath(db_path)
+        held = self._held()
+        entry = held.get(key)
+        outermost = entry is None
+        if outermost:
+            conn, gen = self._checkout(key)
+            entry = held[key] = [conn, gen, 0]
+        conn = entry[0]
+        entry[2] += 1
+        previous_factory = conn.row_factory
+        conn.row_factory = row_factory
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.row_factory = previous_factory
+            entry[2] -= 1
+            if outermost:
+                del held[key]
+                self._checkin(key, conn, entry[1])
+
+    def discard(self, db_path):
+        """Close idle connections for a DB file (call before deleting/replacing it)."""
+        key = os.path.abspath(db_path)
+        with self._lock:
+            self._generation[key] = self._generation.get(key, 0) + 1
+            idle = self._idle.pop(key, [])
+            self._counters(key)["closed"] += len(idle)
+        for conn in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_idle": self.max_idle,
+                "pragmas": list(PRAGMAS),
+                "databases": {
+                    os.path.basename(key): {
+                        "path": key,
+                        "idle": len(self._idle.get(key, [])),
+                        **counters,
+                    }
+                    for key, counters in self._stats.items()
+                },
+            }
+
+
+pool = ConnectionPool()
+
+
+def connect(db_path, row_factory=None):
+    """Drop-in for `with sqlite3.connect(db_path) as conn:` backed by the shared pool."""
+    return pool.connection(db_path, row_factory=row_factory)
+
+
+def discard(db_path):
+    pool.discard(db_path)
+
+
+def pool_stats():
+    return pool.stats()
@@ -0,0 +1,140 @@
+# extraction.py
+"""
+PDF -> page text (native text, else Tesseract OCR, through the page cache) -> sentences.
+Kept free of the embedding model so OCR worker processes (bulk_index) don't load torch.
+"""
+import os
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+
+import fitz  # PyMuPDF
+from PIL import Image
+import pytesseract
+
+import page_cache
+from chunking import safe_sent_tokenize
+
+# Optional: set this only if you know the path. Otherwise comment it out.
+# pytesseract.pytesseract.tesseract_cmd = r"C:\Users\tyamashita\AppData\Local\Programs\Tesseract-OCR\tesseract.exe"
+
+# Scanned-page OCR: concurrent tesseract runs, one per core by default
+OCR_DPI = 300
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", os.cpu_count() or 2))
+# Tesseract's own OpenMP threads would oversubscribe the cores when pages run in parallel
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+def _ocr_image(img):
+    start = time.perf_counter()
+    text = pytesseract.image_to_string(img).strip()
+    return text, time.perf_counter() - start
+
+def iter_page_texts(pdf_path, track=print, ocr_workers=OCR_WORKERS, pdf_sha=None):
+    """
+    Yields each page's text in page order: native text, or Tesseract for pages without any.
+    Pages are rendered here (PyMuPDF is not thread-safe) and OCR'd concurrently: each
+    image_to_string call is its own tesseract process, so a thread pool keeps all cores busy.
+    Only a few pages are held at a time (rendered images and out-of-order results).
+    """
+    ocr_workers = max(1, int(ocr_workers or 1))
+    # Pages already extracted from this exact file (any DB, any earlier run) are reused;
+    # the cache is only an optimisation, so if it can't be read every page is extracted
+    try:
+        pdf_sha = pdf_sha or page_cache.file_sha256(pdf_path)
+        cached = page_cache.load_pages(pdf_sha, OCR_DPI)
+    except Exception as e:
+        print("⚠️ Page cache lookup failed, extracting all pages:", e)
+        cached = {}
+    fresh = []    # (page index, source, text) to add to the cache
+    ready = {}    # page index -> text, waiting for earlier pages
+    pending = {}  # future -> (page index, render seconds)
+    next_page = 0
+
+    def report(fut):
+        i, render_s = pending.pop(fut)
+        try:
+            ocr_text, ocr_s = fut.result()
+        except Exception as e:
+            track(f"❌ OCR error on page {i+1}: {e}")
+            ready[i] = ""
+            return
+        timing = f"(render {render_s:.1f}s, OCR {ocr_s:.1f}s)"
+        if ocr_text:
+            track(f"✅ Page {i+1}: OCR extracted {len(ocr_text.split())} words {timing}")
+        else:
+            track(f"⚠️ Page {i+1}: OCR failed or empty {timing}")
+        ready[i] = ocr_text
+        fresh.append((i, "ocr", ocr_text))
+
+    def drain_ready():
+        nonlocal next_page
+        while next_page in ready:
+            yield ready.pop(next_page)
+            next_page += 1
+
+    def save_fresh():
+        if not pdf_sha:
+            fresh.clear()
+            return
+        try:
+            page_cache.store_pages(pdf_sha, OCR_DPI, fresh)
+        except Exception as e:
+            print("⚠️ Could not update page cache:", e)
+        fresh.clear()
+
+    doc = fitz.open(pdf_path)
+    try:
+        with ThreadPoolExecutor(max_workers=ocr_workers, thread_name_prefix="ocr") as pool:
+            for i, page in enumerate(doc):
+                if i in cached:
+                    source, ready[i] = cached[i]
+                    track(f"♻️ Page {i+1}: Cached {source} text")
+                else:
+                    txt = page.get_text().strip()
+                    if txt:
+                        track(f"✅ Page {i+1}: Found native text")
+                        ready[i] = txt
+                        fresh.append((i, "native", txt))
+                    else:
+                        track(f"🔍 Page {i+1}: No text found, running OCR…")
+                        try:
+                            start = time.perf_counter()
+                            pix = page.get_pixmap(dpi=OCR_DPI)
+                            img = Image.open(io.BytesIO(pix.tobytes("ppm")))
+                            pending[pool.submit(_ocr_image, img)] = (i, time.perf_counter() - start)
+                        except Exception as e:
+                            track(f"❌ OCR error on page {i+1}: {e}")
+                            ready[i] = ""
+                yield from drain_ready()
+                # Bound rendered-but-not-OCR'd images and pages parked behind a slow OCR page
+                while pending and len(pending) + len(ready) >= 2 * ocr_workers:
+                    done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        report(fut)
+                    yield from drain_ready()
+                if len(fresh) >= 32:
+                    save_fresh()
+            for fut in as_completed(list(pending)):
+                report(fut)
+                yield from drain_ready()
+    finally:
+        doc.close()
+        save_fresh()
+
+def extract_text_from_pdf_with_ocr_fallback(pdf_path, track=print, ocr_workers=OCR_WORKERS, pdf_sha=None):
+    texts = iter_page_texts(pdf_path, track, ocr_workers, pdf_sha)
+    return "\n\n".join([t for t in texts if t and t.strip()])
+
+def iter_document_sentences(page_texts):
+    """Sentences across pages; a page's last sentence waits for the next page in case it continues there."""
+    carry = ""
+    for text in page_texts:
+        if not text or not text.strip():
+            continue
+        sentences = safe_sent_tokenize(f"{carry}\n\n{text}" if carry else text)
+        if not sentences:
+            continue
+        carry = sentences.pop()
+        yield from sentences
+    if carry:
+        yield carry
@@ -1,6 +1,6 @@
 # helpers.py
 import re
-import sqlite3
+from db_pool import connect
 from collections import defaultdict, Counter
 import math
 import heapq
@@ -52,7 +52,7 @@ import numpy as np
 def rank_documents(query, db_path, min_wo=0, max_wo=99999, top_k=20):
     query_tokens = preprocess_query(query)
 
-    with sqlite3.connect(db_path) as conn:
+    with connect(db_path) as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
         tables = {row[0] for row in cursor.fetchall()}
@@ -101,20 +101,20 @@ def rank_documents(query, db_path, min_wo=0, max_wo=99999, top_k=20):
         ]
 
 def get_quick_view_sentences(file, query, db_path):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    with connect(db_path) as conn:
+        cursor = conn.cursor()
 
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-    tables = {row[0] for row in cursor.fetchall()}
-    if "chunks" not in tables:
-        raise Exception("❌ 'chunks' table not found in database.")
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+        tables = {row[0] for row in cursor.fetchall()}
+        if "chunks" not in tables:
+            raise Exception("❌ 'chunks' table not found in database.")
 
-    cursor.execute("PRAGMA table_info(chunks)")
-    columns = {col[1] for col in cursor.fetchall()}
-    col = "text" if "text" in columns else "chunk"
+        cursor.execute("PRAGMA table_info(chunks)")
+        columns = {col[1] for col in cursor.fetchall()}
+        col = "text" if "text" in columns else "chunk"
 
-    cursor.execute(f"SELECT {col} FROM chunks WHERE file = ?", (file,))
-    rows = cursor.fetchall()
+        cursor.execute(f"SELECT {col} FROM chunks WHERE file = ?", (file,))
+        rows = cursor.fetchall()
 
     full_text = " ".join(row[0] for row in rows if isinstance(row[0], str))
     print(f"🤖 Loaded {len(full_text.split())} words from {file}")
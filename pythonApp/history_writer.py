@@ -0,0 +1,166 @@
+# history_writer.py
+import os
+import time
+import queue
+import atexit
+import threading
+
+from db_pool import connect
+
+# ---------------------- CONFIG ----------------------
+FLUSH_INTERVAL_MS = int(os.environ.get("HISTORY_FLUSH_INTERVAL_MS", "20"))
+MAX_BATCH = int(os.environ.get("HISTORY_MAX_BATCH", "500"))
+QUEUE_MAX = int(os.environ.get("HISTORY_QUEUE_MAX", "10000"))
+# Backpressure: a full queue makes the request wait this long for room before the row is dropped.
+ENQUEUE_TIMEOUT_S = float(os.environ.get("HISTORY_ENQUEUE_TIMEOUT_S", "0.05"))
+
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """
+    Background writer for small history INSERTs (chat_history, upload_history).
+
+    Requests call submit() and return immediately; a single daemon thread drains
+    the bounded queue and commits everything it collected within FLUSH_INTERVAL_MS
+    (up to MAX_BATCH rows) as one transaction, so the fsync is off the request path.
+    """
+
+    def __init__(self, db_path, flush_interval_ms=FLUSH_INTERVAL_MS, max_batch=MAX_BATCH,
+                 queue_max=QUEUE_MAX, enqueue_timeout=ENQUEUE_TIMEOUT_S):
+        self.db_path = db_path
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch = max_batch
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(maxsize=queue_max)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stats = {"submitted": 0, "written": 0, "dropped": 0, "failed": 0, "batches": 0}
+
+    # ---------------------- producer side ----------------------
+    def submit(self, sql, params=()):
+        """Queue one write. Returns False if it was dropped (queue full or writer closed)."""
+        if self._closed:
+            self._stats["dropped"] += 1
+            return False
+        self._ensure_started()
+        try:
+            self._queue.put((sql, tuple(params)), timeout=self.enqueue_timeout)
+        except queue.Full:
+            self._stats["dropped"] += 1
+            print(f"⚠️ History queue full, dropped write to {os.path.basename(self.db_path)}")
+            return False
+        self._stats["submitted"] += 1
+        return True
+
+    def flush(self, timeout=5.0):
+        """Block until everything queued before this call is committed."""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        """Flush pending rows and stop the writer thread (registered with atexit)."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            print("⚠️ History queue still full at shutdown; pending rows may be lost")
+            return
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {**self._stats, "pending": self._queue.qsize(), "running": bool(self._thread and self._thread.is_alive())}
+
+    # ---------------------- writer thread ----------------------
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=f"history-writer:{os.path.basename(self.db_path)}", daemon=True
+                )
+                self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch and batch[-1] is not _STOP:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, rows):
+        if not rows:
+            return
+        try:
+            with connect(self.db_path) as conn:
+                # Consecutive rows for the same statement go through one executemany
+                start = 0
+                for i in range(1, len(rows) + 1):
+                    if i == len(rows) or rows[i][0] != rows[start][0]:
+                        conn.executemany(rows[start][0], [params for _, params in rows[start:i]])
+                        start = i
+            self._stats["written"] += len(rows)
+            self._stats["batches"] += 1
+        except Exception as e:
+            self._stats["failed"] += len(rows)
+            print(f"❌ History batch write failed ({len(rows)} rows): {e}")
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            rows = [item for item in batch if isinstance(item, tuple)]
+            self._write(rows)
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+            if any(item is _STOP for item in batch):
+                return
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def writer_for(db_path):
+    """One shared write-behind queue per DB file."""
+    key = os.path.abspath(db_path)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None:
+            writer = _writers[key] = WriteBehindQueue(key)
+        return writer
+
+
+def submit(db_path, sql, params=()):
+    return writer_for(db_path).submit(sql, params)
+
+
+def writer_stats():
+    with _writers_lock:
+        return {os.path.basename(k): w.stats() for k, w in _writers.items()}
+
+
+@atexit.register
+def _flush_on_shutdown():
+    with _writers_lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        writer.close()
@@ -0,0 +1,308 @@
+# jobs.py
+import os
+import json
+import time
+import uuid
+import socket
+import threading
+import traceback
+from datetime import datetime, timedelta
+from flask import Blueprint, request, jsonify, Response
+
+from db_pool import connect
+
+jobs_bp = Blueprint("jobs", __name__)
+
+# ---------------------- CONFIG ----------------------
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+# Kept out of uploads/ top level so /api/list-dbs doesn't list the queue as a knowledge base
+JOBS_DIR = os.path.join(BASE_DIR, "uploads", "jobs")
+JOBS_DB = os.path.join(JOBS_DIR, "jobs.sqlite3")
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+POLL_INTERVAL_S = 1.0          # idle workers re-check the table this often
+STREAM_INTERVAL_S = 0.5        # SSE polling interval for /api/jobs/<id>?stream=1
+FINISHED = ("done", "failed")
+# A running job belongs to the process that claimed it for LEASE_S, renewed every LEASE_S / 3 while
+# that process is alive; only expired leases are taken over (a reloader child, another gunicorn
+# worker or a restart after a crash), so a job is never run by two live processes at once.
+LEASE_S = float(os.environ.get("JOB_LEASE_S", "60"))
+# Finished jobs and their messages are deleted after this many days (at startup, then hourly)
+JOB_RETENTION_DAYS = float(os.environ.get("JOB_RETENTION_DAYS", "14"))
+PURGE_INTERVAL_S = 3600
+
+_handlers = {}
+_wakeup = threading.Condition()
+_workers = []
+
+# ---------------------- DB bootstrap ----------------------
+def init_jobs_db():
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    with connect(JOBS_DB) as conn:
+        conn.executescript("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT,
+            status TEXT,          -- 'queued' | 'running' | 'done' | 'failed'
+            progress INTEGER DEFAULT 0,
+            params TEXT,          -- JSON
+            result TEXT,          -- JSON
+            error TEXT,
+            created_at TEXT,
+            started_at TEXT,
+            finished_at TEXT,
+            owner TEXT,           -- host:pid of the process running it
+            lease_until REAL      -- epoch seconds; expired -> the owner is gone, job can be re-run
+        );
+
+        CREATE TABLE IF NOT EXISTS job_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id TEXT,
+            ts TEXT,
+            message TEXT
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at);
+        CREATE INDEX IF NOT EXISTS idx_job_messages_job ON job_messages(job_id, id);
+        """)
+        columns = {r[1] for r in conn.execute("PRAGMA table_info(jobs)")}
+        for col, decl in (("owner", "TEXT"), ("lease_until", "REAL")):
+            if col not in columns:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {col} {decl}")
+        # Jobs left 'running' by a dead process are picked up by _claim() once their lease expires
+
+def purge_finished_jobs(days=JOB_RETENTION_DAYS):
+    """Delete done/failed jobs finished more than `days` ago, with their messages; returns the job count."""
+    cutoff = (datetime.utcnow() - timedelta(days=days)).isoformat()
+    with connect(JOBS_DB) as conn:
+        old = "SELECT id FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?"
+        conn.execute(f"DELETE FROM job_messages WHERE job_id IN ({old})", (cutoff,))
+        purged = conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                              (cutoff,)).rowcount
+    if purged:
+        print(f"🧹 Purged {purged} jobs finished before {cutoff[:10]}")
+    return purged
+
+def _now():
+    return datetime.utcnow().isoformat()
+
+def _owner():
+    # pid looked up each time: the reloader / gunicorn fork after this module is imported
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+# ---------------------- Producer side ----------------------
+def register_handler(kind, fn):
+    """fn(params, job) runs on a worker thread; its return value (JSON-able) becomes the job result."""
+    _handlers[kind] = fn
+
+def staging_path(filename):
+    """Where request handlers save uploads that a queued job will pick up later."""
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    return os.path.join(JOBS_DIR, f"{uuid.uuid4().hex}_{os.path.basename(filename)}")
+
+def enqueue(kind, params):
+    job_id = uuid.uuid4().hex
+    with connect(JOBS_DB) as conn:
+        conn.execute("""
+            INSERT INTO jobs (id, kind, status, progress, params, created_at)
+            VALUES (?, ?, 'queued', 0, ?, ?)
+        """, (job_id, kind, json.dumps(params), _now()))
+    with _wakeup:
+        _wakeup.notify()
+    return job_id
+
+def get_job(job_id, since=0):
+    """Job status plus messages with id > since (pass the last `cursor` back to poll incrementally)."""
+    with connect(JOBS_DB) as conn:
+        row = conn.execute("""
+            SELECT id, kind, status, progress, result, error, created_at, started_at, finished_at
+            FROM jobs WHERE id = ?
+        """, (job_id,)).fetchone()
+        if not row:
+            return None
+        messages = conn.execute("""
+            SELECT id, ts, message FROM job_messages
+            WHERE job_id = ? AND id > ?
+            ORDER BY id
+        """, (job_id, since)).fetchall()
+    return {
+        "id": row[0],
+        "kind": row[1],
+        "status": row[2],
+        "progress": row[3],
+        "result": json.loads(row[4]) if row[4] else None,
+        "error": row[5],
+        "created_at": row[6],
+        "started_at": row[7],
+        "finished_at": row[8],
+        "messages": [m[2] for m in messages],
+        "cursor": messages[-1][0] if messages else since,
+    }
+
+# ---------------------- Worker side ----------------------
+class JobContext:
+    """Handed to handlers: track() mirrors the old `track` callback and also records progress."""
+
+    def __init__(self, job_id):
+        self.id = job_id
+
+    def track(self, msg, progress=None):
+        print(msg)
+        with connect(JOBS_DB) as conn:
+            conn.execute("INSERT INTO job_messages (job_id, ts, message) VALUES (?, ?, ?)",
+                         (self.id, _now(), str(msg)))
+            if progress is not None:
+                conn.execute("UPDATE jobs SET progress = ? WHERE id = ?",
+                             (max(0, min(100, int(progress))), self.id))
+
+    def progress(self, pct):
+        with connect(JOBS_DB) as conn:
+            conn.execute("UPDATE jobs SET progress = ? WHERE id = ?", (max(0, min(100, int(pct))), self.id))
+
+def _claim():
+    """Next queued job, or a running one whose owner stopped renewing its lease."""
+    now = time.time()
+    with connect(JOBS_DB) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("""
+            SELECT id, kind, params, status, owner FROM jobs
+            WHERE status = 'queued'
+               OR (status = 'running' AND (lease_until IS NULL OR lease_until < ?))
+            ORDER BY created_at, rowid
+            LIMIT 1
+        """, (now,)).fetchone()
+        if row:
+            conn.execute("""
+                UPDATE jobs SET status = 'running', started_at = ?, owner = ?, lease_until = ?
+                WHERE id = ?
+            """, (_now(), _owner(), now + LEASE_S, row[0]))
+    if row and row[3] == "running":
+        print(f"♻️ Job {row[0]} lease from {row[4]} expired; running it again")
+    return row and row[:3]
+
+def _renew_leases():
+    """Heartbeat: extend the lease of every job this process is running; purge old jobs now and then."""
+    next_purge = time.time() + PURGE_INTERVAL_S
+    while True:
+        time.sleep(LEASE_S / 3)
+        try:
+            with connect(JOBS_DB) as conn:
+                conn.execute("UPDATE jobs SET lease_until = ? WHERE status = 'running' AND owner = ?",
+                             (time.time() + LEASE_S, _owner()))
+        except Exception as e:
+            print("⚠️ Job lease renewal failed:", e)
+        if time.time() >= next_purge:
+            next_purge = time.time() + PURGE_INTERVAL_S
+            try:
+                purge_finished_jobs()
+            except Exception as e:
+                print("⚠️ Job purge failed:", e)
+
+def _finish(job_id, status, result=None, error=None):
+    with connect(JOBS_DB) as conn:
+        # owner check: if the lease was lost and someone else re-ran the job, theirs is the result
+        conn.execute("""
+            UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_until = NULL,
+                            progress = CASE WHEN ? = 'done' THEN 100 ELSE progress END
+            WHERE id = ? AND owner = ?
+        """, (status, json.dumps(result) if result is not None else None, error, _now(), status,
+              job_id, _owner()))
+
+def _run_one():
+    row = _claim()
+    if not row:
+        return False
+    job_id, kind, params = row
+    job = JobContext(job_id)
+    handler = _handlers.get(kind)
+    if handler is None:
+        _finish(job_id, "failed", error=f"No handler registered for '{kind}'")
+        return True
+    try:
+        result = handler(json.loads(params or "{}"), job)
+        _finish(job_id, "done", result=result)
+    except Exception as e:
+        traceback.print_exc()
+        try:
+            job.track(f"❌ Job failed: {e}")
+        except Exception:
+            pass
+        _finish(job_id, "failed", error=str(e))
+    return True
+
+def _worker_loop():
+    while True:
+        try:
+            if _run_one():
+                continue
+        except Exception as e:
+            print("❌ Job worker error:", e)
+        with _wakeup:
+            _wakeup.wait(POLL_INTERVAL_S)
+
+def start_workers(n=JOB_WORKERS):
+    if _workers:
+        return
+    for i in range(max(1, n)):
+        t = threading.Thread(target=_worker_loop, name=f"job-worker-{i}", daemon=True)
+        t.start()
+        _workers.append(t)
+    threading.Thread(target=_renew_leases, name="job-lease-heartbeat", daemon=True).start()
+    print(f"✅ Job queue ready ({len(_workers)} workers)")
+
+@jobs_bp.record_once
+def _on_register(setup_state):
+    init_jobs_db()
+    try:
+        purge_finished_jobs()
+    except Exception as e:
+        print("⚠️ Job purge failed:", e)
+    start_workers()
+
+# ---------------------- Routes ----------------------
+@jobs_bp.route("/api/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """
+    Poll: GET /api/jobs/<id>?since=<cursor>  -> { status, progress, messages[], cursor, result }
+    Stream: GET /api/jobs/<id>?stream=1      -> text/event-stream of the same objects until finished
+    """
+    try:
+        since = int(request.args.get("since", 0))
+    except ValueError:
+        since = 0
+
+    if request.args.get("stream") != "1":
+        job = get_job(job_id, since)
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(job)
+
+    if not get_job(job_id, since):
+        return jsonify({"error": "Job not found"}), 404
+
+    def events(cursor):
+        while True:
+            job = get_job(job_id, cursor)
+            if job is None:
+                return
+            cursor = job["cursor"]
+            yield f"data: {json.dumps(job)}\n\n"
+            if job["status"] in FINISHED:
+                return
+            time.sleep(STREAM_INTERVAL_S)
+
+    return Response(events(since), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@jobs_bp.route("/api/jobs", methods=["GET"])
+def list_jobs():
+    try:
+        limit = max(1, min(200, int(request.args.get("limit", 50))))
+    except ValueError:
+        limit = 50
+    with connect(JOBS_DB) as conn:
+        rows = conn.execute("""
+            SELECT id, kind, status, progress, error, created_at, started_at, finished_at
+            FROM jobs ORDER BY created_at DESC LIMIT ?
+        """, (limit,)).fetchall()
+    keys = ("id", "kind", "status", "progress", "error", "created_at", "started_at", "finished_at")
+    return jsonify({"jobs": [dict(zip(keys, r)) for r in rows]})
@@ -0,0 +1,79 @@
+# benchmark_chunker.py
+# Compares the original quadratic admin.chunk_text with chunking.chunk_sentences.
+# Run from pythonApp/:  python non-app-related/benchmark_chunker.py [some.pdf]
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from chunking import CHUNK_SIZE, OVERLAP, chunk_sentences, safe_sent_tokenize
+
+# ============== CONFIG ==============
+SENTENCE_COUNTS = [1_000, 5_000, 20_000, 50_000]   # synthetic document sizes
+REPEATS = 3
+# ====================================
+
+def legacy_chunk_sentences(sentences, chunk_size=CHUNK_SIZE, overlap=OVERLAP):
+    """admin.chunk_text as it was, minus sentence splitting."""
+    chunks = []
+    current = []
+    for sentence in sentences:
+        current.append(sentence)
+        total_words = sum(len(s.split()) for s in current)
+        if total_words >= chunk_size:
+            chunks.append(' '.join(current))
+            new_chunk = []
+            overlap_words = 0
+            for s in reversed(current):
+                overlap_words += len(s.split())
+                new_chunk.insert(0, s)
+                if overlap_words >= overlap:
+                    break
+            current = new_chunk
+    if current:
+        chunks.append(' '.join(current))
+    return chunks
+
+def synthetic_sentences(n, seed=7):
+    rnd = random.Random(seed)
+    vocab = ["boring", "sample", "clay", "basalt", "groundwater", "foundation", "settlement",
+             "bearing", "capacity", "slope", "pile", "Geolabs", "recommend", "site", "layer"]
+    return [
+        " ".join(rnd.choice(vocab) for _ in range(rnd.randint(4, 40))).capitalize() + "."
+        for _ in range(n)
+    ]
+
+def pdf_sentences(path):
+    import fitz  # PyMuPDF
+    with fitz.open(path) as doc:
+        text = "\n\n".join(page.get_text() for page in doc)
+    return safe_sent_tokenize(text)
+
+def best_of(fn, *args):
+    best = float("inf")
+    out = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        out = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+def run(label, sentences):
+    words = sum(len(s.split()) for s in sentences)
+    t_old, old = best_of(legacy_chunk_sentences, sentences)
+    t_new, new = best_of(chunk_sentences, sentences)
+    same = old == [c for c, _ in new]
+    print(f"{label:>22} | {len(sentences):>7} sents {words:>9} words | "
+          f"legacy {t_old*1000:9.1f} ms | deque {t_new*1000:8.1f} ms | "
+          f"x{t_old / max(t_new, 1e-9):6.1f} | identical={same}")
+    if not same:
+        raise SystemExit("❌ Chunk output differs from the legacy implementation")
+
+if __name__ == "__main__":
+    print(f"chunk_size={CHUNK_SIZE} words, overlap={OVERLAP} words, best of {REPEATS}")
+    if len(sys.argv) > 1:
+        run(os.path.basename(sys.argv[1]), pdf_sentences(sys.argv[1]))
+    for n in SENTENCE_COUNTS:
+        run("synthetic", synthetic_sentences(n))
+    print("✅ Done")
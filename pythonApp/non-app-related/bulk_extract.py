@@ -0,0 +1,44 @@
+# bulk_extract.py
+"""
+Worker side of bulk_index.py: hash, skip if unchanged, else pages -> sentences.
+Imports nothing that loads the embedding model, so worker processes stay small whether they
+are forked or spawned; chunking and embedding happen in bulk_index's main process.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import page_cache
+import thumbnails
+from extraction import iter_page_texts, iter_document_sentences
+
+def extract_document(task):
+    """Runs in a worker process. Returns a plain dict (picklable)."""
+    path, indexed, embed_version, ocr_workers, db_name = task
+    file_name = os.path.basename(path)
+    start = time.perf_counter()
+    try:
+        sha = page_cache.file_sha256(path)
+        if indexed == (sha, embed_version):
+            return {"file": file_name, "path": path, "skipped": True}
+        thumbnails.pregenerate(path, sha, db_name, file_name, track=lambda msg: None)
+
+        pages = 0
+        def counted(texts):
+            nonlocal pages
+            for text in texts:
+                pages += 1
+                yield text
+
+        def track(msg):
+            if msg.startswith("❌"):
+                print(f"   {file_name}: {msg}", flush=True)
+
+        texts = iter_page_texts(path, track, ocr_workers=ocr_workers, pdf_sha=sha)
+        sentences = list(iter_document_sentences(counted(texts)))
+        return {"file": file_name, "path": path, "sha": sha, "pages": pages, "sentences": sentences,
+                "replaced": indexed is not None, "seconds": time.perf_counter() - start}
+    except Exception as e:
+        return {"file": file_name, "path": path, "error": str(e)}
@@ -0,0 +1,187 @@
+# bulk_index.py
+"""
+Index a whole folder of PDFs into one knowledge-base DB (same tables as /api/process-file).
+
+Usage (from pythonApp/):
+    python non-app-related/bulk_index.py /path/to/archive my_docs.db [--workers 4] [--force] [--s3]
+
+How it works:
+- Worker processes (bulk_extract.py) extract pages (native text / OCR through the page cache)
+  into sentences, several PDFs at a time. They never import admin, so they don't load the model;
+  the pool is started before the main process imports admin (and torch).
+- The main process chunks each document as admin.embed_to_db does and embeds chunks in
+  batches that span documents (a 3-chunk memo and a 400-chunk report share batches), then
+  writes each finished file in its own transaction with its file_manifest row.
+- Resume: files already in file_manifest with the same sha256 and embed version are skipped,
+  so re-running after Ctrl+C / a crash picks up where it stopped. --force re-indexes everything.
+- First-page thumbnails are rendered along the way, as embed_to_db does.
+- Prints pages/s and chunks/s as it goes and a summary at the end.
+"""
+import os
+import sys
+import time
+import argparse
+import importlib
+import multiprocessing as mp
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from db_pool import connect, discard
+from bulk_extract import extract_document
+# admin (torch + the embedding model) is imported in main() after the worker pool exists
+admin = None
+
+# ============== CONFIG ==============
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+BATCH_SIZE = int(os.environ.get("BULK_EMBED_BATCH", "32"))    # chunks per embedding call, across documents
+# ====================================
+
+def find_pdfs(root):
+    """Sorted PDF paths under root; later files with an already-seen name are skipped (chunks are keyed by file name)."""
+    paths, seen = [], {}
+    for dirpath, _, files in os.walk(root):
+        for name in sorted(files):
+            if name.lower().endswith(".pdf"):
+                paths.append(os.path.join(dirpath, name))
+    unique = []
+    for path in sorted(paths):
+        name = os.path.basename(path)
+        if name in seen:
+            print(f"⚠️ Duplicate file name, skipping {path} (already have {seen[name]})")
+            continue
+        seen[name] = path
+        unique.append(path)
+    return unique
+
+def load_manifest(db_path):
+    """{file: (sha256, embed_version)}; pooled connections are dropped afterwards."""
+    if not os.path.exists(db_path):
+        return {}
+    try:
+        with connect(db_path) as conn:
+            admin.create_chunks_table(conn)
+            rows = conn.execute("SELECT file, sha256, embed_version FROM file_manifest").fetchall()
+    finally:
+        discard(db_path)
+    return {file: (sha, version) for file, sha, version in rows}
+
+# ---------------------- Main process ----------------------
+class BulkIndexer:
+    def __init__(self, db_path, batch_size=BATCH_SIZE, s3_db_name=None):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.s3_db_name = s3_db_name
+        self.docs = {}        # file -> extracted doc waiting for embeddings
+        self.buffer = []      # (file, chunk index, text) not yet embedded
+        self.started = time.perf_counter()
+        self.stats = {"indexed": 0, "skipped": 0, "failed": 0, "empty": 0, "pages": 0, "chunks": 0}
+
+    def add(self, doc):
+        doc["chunks"] = list(admin.iter_document_chunks(iter(doc.pop("sentences"))))
+        if not doc["chunks"]:
+            self.stats["empty"] += 1
+            print(f"⚠️ No extractable text in: {doc['file']}")
+            return
+        doc["embeddings"] = [None] * len(doc["chunks"])
+        doc["remaining"] = len(doc["chunks"])
+        self.docs[doc["file"]] = doc
+        self.buffer.extend((doc["file"], i, text) for i, (text, _) in enumerate(doc["chunks"]))
+        while len(self.buffer) >= self.batch_size:
+            self._embed(self.buffer[:self.batch_size])
+            del self.buffer[:self.batch_size]
+
+    def finish(self):
+        if self.buffer:
+            self._embed(self.buffer)
+            self.buffer = []
+
+    def _embed(self, batch):
+        embeddings = admin.compute_embeddings([text for _, _, text in batch])
+        for (file_name, i, _), emb in zip(batch, embeddings):
+            doc = self.docs[file_name]
+            doc["embeddings"][i] = emb
+            doc["remaining"] -= 1
+            if doc["remaining"] == 0:
+                self._write(self.docs.pop(file_name))
+
+    def _write(self, doc):
+        chunks = [text for text, _ in doc["chunks"]]
+        counts = [n for _, n in doc["chunks"]]
+        if any(n is None for n in counts):
+            counts = [len(ids) for ids in admin.tokenize(chunks, add_special_tokens=False)["input_ids"]]
+        try:
+            with admin.bulk_transaction(self.db_path) as conn:
+                admin.create_chunks_table(conn)
+                admin.replace_file_chunks(conn, doc["file"], chunks, doc["embeddings"], doc["sha"], counts)
+        except Exception as e:
+            self.stats["failed"] += 1
+            print(f"❌ Database write failed for {doc['file']}: {e}")
+            return
+        if self.s3_db_name:
+            admin.upload_pdf_to_s3(doc["path"], self.s3_db_name, doc["file"])
+        self.stats["indexed"] += 1
+        self.stats["pages"] += doc["pages"]
+        self.stats["chunks"] += len(chunks)
+        verb = "Re-indexed" if doc["replaced"] else "Indexed"
+        print(f"✅ {verb} {doc['file']}: {doc['pages']} pages, {len(chunks)} chunks "
+              f"(extracted in {doc['seconds']:.1f}s) | {self.throughput()}", flush=True)
+
+    def throughput(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return f"{self.stats['pages'] / elapsed:.2f} pages/s, {self.stats['chunks'] / elapsed:.2f} chunks/s"
+
+def main():
+    global admin
+    parser = argparse.ArgumentParser(description="Bulk-index a folder of PDFs into a knowledge-base DB.")
+    parser.add_argument("folder", help="Folder to scan (recursively) for PDFs")
+    parser.add_argument("db", help="DB file name in uploads/ (e.g. my_docs.db) or a path")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Extraction processes")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Chunks per embedding batch")
+    parser.add_argument("--force", action="store_true", help="Re-index files even if unchanged")
+    parser.add_argument("--s3", action="store_true", help="Also upload each indexed PDF to S3 under {db}/")
+    args = parser.parse_args()
+
+    pdfs = find_pdfs(args.folder)
+    if not pdfs:
+        print(f"⚠️ No PDFs found under {args.folder}")
+        return
+    workers = max(1, args.workers)
+    # Split the cores between processes so per-page OCR threads don't oversubscribe them
+    ocr_workers = max(1, (os.cpu_count() or 2) // workers)
+
+    indexer = None
+    done = 0
+    try:
+        # Workers start (fork/spawn) before torch is loaded here
+        with mp.Pool(workers) as pool:
+            admin = importlib.import_module("admin")
+            db_path = args.db if os.path.dirname(args.db) else os.path.join(admin.UPLOAD_FOLDER, args.db)
+            manifest = {} if args.force else load_manifest(db_path)
+            print(f"📂 {len(pdfs)} PDFs -> {db_path} | {workers} workers x {ocr_workers} OCR threads | "
+                  f"embedding batch {args.batch_size} | {len(manifest)} files already indexed")
+            indexer = BulkIndexer(db_path, args.batch_size, os.path.basename(db_path) if args.s3 else None)
+            tasks = [(path, manifest.get(os.path.basename(path)), admin.EMBED_VERSION, ocr_workers,
+                      os.path.basename(db_path)) for path in pdfs]
+            for doc in pool.imap_unordered(extract_document, tasks):
+                done += 1
+                if doc.get("skipped"):
+                    indexer.stats["skipped"] += 1
+                    print(f"⏭️ [{done}/{len(pdfs)}] {doc['file']} unchanged, skipping")
+                elif doc.get("error"):
+                    indexer.stats["failed"] += 1
+                    print(f"❌ [{done}/{len(pdfs)}] {doc['file']}: {doc['error']}")
+                else:
+                    print(f"📄 [{done}/{len(pdfs)}] {doc['file']}: extracted {doc['pages']} pages")
+                    indexer.add(doc)
+        indexer.finish()
+    except KeyboardInterrupt:
+        print("\n🛑 Interrupted. Files written so far are kept; re-run the same command to resume.")
+    finally:
+        if indexer is not None:
+            elapsed = time.perf_counter() - indexer.started
+            s = indexer.stats
+            print(f"🎉 {s['indexed']} indexed, {s['skipped']} skipped, {s['empty']} empty, {s['failed']} failed | "
+                  f"{s['pages']} pages, {s['chunks']} chunks in {elapsed:.1f}s | {indexer.throughput()}")
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,29 @@
 # create_box_inventory.py
 import os
+import json
 import sqlite3
+import argparse
+from datetime import datetime
 import pandas as pd
 import numpy as np
 
 # ============== CONFIG ==============
-XLSX_FILE = "Maui Core Box Inventory.xlsx"     # your workbook
-ISLAND     = "Maui"                             # constant tag for this file
+# (workbook, island tag) pairs processed in one run; override on the command line:
+#   python create_box_inventory.py "Maui Core Box Inventory.xlsx=Maui" "Hawaii Core Box Inventory.xlsx=Hawaii"
+WORKBOOKS  = [
+    ("Maui Core Box Inventory.xlsx", "Maui"),
+]
 DB_DIR     = "uploads"
 DB_PATH    = os.path.join(DB_DIR, "core_box_inventory.db")
 TABLE      = "core_boxes"
 
-# Rebuild table every run (recommended to avoid build-up)
-WRITE_MODE = "replace"   # 'replace' or 'append'
+# 'sync'    (default) upsert per (island, work_order): only fields the workbook changed since the
+#           last import are written, each change is logged in core_boxes_changes, nothing is
+#           deleted (other islands and web-app edits to other fields are kept)
+# 'replace' wipe the whole table and re-insert everything from the workbooks
+# 'append'  insert everything as-is
+WRITE_MODE  = "sync"
+IMPORT_USER = "importer"   # `user` on core_boxes_changes rows written by sync
 # ====================================
 
 # Tokens we treat as “bad/missing dates” (case-insensitive)
@@ -108,137 +119,299 @@ def has_work_order(v) -> bool:
     return not is_na_like(v) and str(v).strip() != ""
 
 # ------------- Load & union all sheets -------------
-print(f"📥 Reading workbook: {XLSX_FILE}")
-xls = pd.ExcelFile(XLSX_FILE)
-frames = []
-
-for sheet in xls.sheet_names:
-    df = xls.parse(sheet)
-    if df.empty or len(df.columns) == 0:
-        continue
-    df = normalize_columns(df)
-
-    # Ensure columns exist
-    for c in [
-        "work_order", "project", "engineer",
-        "report_submission_date", "two_month_storage_date",
-        "storage_expiry_date", "complete", "keep_or_dump"
-    ]:
-        if c not in df.columns:
-            df[c] = np.nan
-
-    # Parse submission / expiry
-    sub = df["report_submission_date"].apply(to_date)
-
-    # Provided expiry: prefer explicit "storage_expiry_date" if present, else "two_month_storage_date"
-    exp_from_sheet = df["storage_expiry_date"].apply(to_date) if "storage_expiry_date" in df.columns else pd.Series([pd.NaT]*len(df))
-    exp_2mo        = df["two_month_storage_date"].apply(to_date)
-    expiry = exp_from_sheet.copy()
-    expiry = expiry.fillna(exp_2mo)
-
-    # If still missing, compute from submission (+3 months)
-    compute_mask = expiry.isna() & sub.notna()
-    expiry.loc[compute_mask] = sub.loc[compute_mask] + pd.DateOffset(months=3)
-
-    out = pd.DataFrame({
-        "year": sub.dt.year.where(sub.notna(), expiry.dt.year),  # use submission year, else expiry year
-        "island": ISLAND,
-        "work_order": df["work_order"].apply(clean_text),
-        "project": df["project"].apply(clean_text),
-        "engineer": df["engineer"].apply(clean_text),
-        "report_submission_date": sub,
-        "storage_expiry_date": expiry,
-        "complete": df["complete"].apply(clean_text),
-        "keep_or_dump": df["keep_or_dump"].apply(clean_text),
-    })
-
-    # Keep ONLY rows that actually have a Work Order
-    out = out[out["work_order"].apply(has_work_order)]
-
-    # Drop rows that are totally empty otherwise (rare)
-    out = out[~(out["project"].isna() & out["engineer"].isna() & out["report_submission_date"].isna() & out["storage_expiry_date"].isna())]
-
-    frames.append(out)
-
-if not frames:
-    raise SystemExit("❌ No usable sheets found.")
-
-df_all = pd.concat(frames, ignore_index=True)
-
-# ------------- Pick one row per Work Order (most recent) -------------
-# "Row date" = most recent of submission/expiry; rows with any date beat rows with no dates
-row_date = pd.concat(
-    [df_all["report_submission_date"], df_all["storage_expiry_date"]],
-    axis=1
-).max(axis=1)  # max handles NaT: returns the valid one if any; NaT if both NaT
-
-df_all["__row_date"] = row_date
-df_all["__has_date"] = df_all["__row_date"].notna()
-
-# Optional tie-breaker: prefer Dump over Keep over Save when dates tie
-keep_rank_map = {"dump": 3, "keep": 2, "save": 1}
-df_all["__keep_rank"] = df_all["keep_or_dump"].str.strip().str.lower().map(keep_rank_map).fillna(0)
-
-# Sort: has_date(desc), row_date(desc), keep_rank(desc) then drop duplicates by work_order
-df_all_sorted = df_all.sort_values(
-    by=["__has_date", "__row_date", "__keep_rank"],
-    ascending=[False, False, False],
-    kind="mergesort"  # stable
-)
-
-best_per_wo = df_all_sorted.drop_duplicates(subset=["work_order"], keep="first").copy()
-
-# Recompute year deterministically: prefer submission year else expiry year
-best_per_wo["year"] = np.where(
-    best_per_wo["report_submission_date"].notna(),
-    best_per_wo["report_submission_date"].dt.year,
-    best_per_wo["storage_expiry_date"].dt.year
-)
-
-# ------------- Final formatting -------------
-for dc in ["report_submission_date", "storage_expiry_date"]:
-    best_per_wo[dc] = best_per_wo[dc].dt.strftime("%Y-%m-%d")
-
-final_df = best_per_wo[FINAL_COLS].copy()
+def load_workbook(xlsx_file, island):
+    """All sheets of one workbook, cleaned to FINAL_COLS (+ helper cols) and tagged with `island`."""
+    print(f"📥 Reading workbook: {xlsx_file} ({island})")
+    xls = pd.ExcelFile(xlsx_file)
+    frames = []
+
+    for sheet in xls.sheet_names:
+        df = xls.parse(sheet)
+        if df.empty or len(df.columns) == 0:
+            continue
+        df = normalize_columns(df)
+
+        # Ensure columns exist
+        for c in [
+            "work_order", "project", "engineer",
+            "report_submission_date", "two_month_storage_date",
+            "storage_expiry_date", "complete", "keep_or_dump"
+        ]:
+            if c not in df.columns:
+                df[c] = np.nan
+
+        # Parse submission / expiry
+        sub = df["report_submission_date"].apply(to_date)
+
+        # Provided expiry: prefer explicit "storage_expiry_date" if present, else "two_month_storage_date"
+        exp_from_sheet = df["storage_expiry_date"].apply(to_date) if "storage_expiry_date" in df.columns else pd.Series([pd.NaT]*len(df))
+        exp_2mo        = df["two_month_storage_date"].apply(to_date)
+        expiry = exp_from_sheet.copy()
+        expiry = expiry.fillna(exp_2mo)
+
+        # If still missing, compute from submission (+3 months)
+        compute_mask = expiry.isna() & sub.notna()
+        expiry.loc[compute_mask] = sub.loc[compute_mask] + pd.DateOffset(months=3)
+
+        out = pd.DataFrame({
+            "year": sub.dt.year.where(sub.notna(), expiry.dt.year),  # use submission year, else expiry year
+            "island": island,
+            "work_order": df["work_order"].apply(clean_text),
+            "project": df["project"].apply(clean_text),
+            "engineer": df["engineer"].apply(clean_text),
+            "report_submission_date": sub,
+            "storage_expiry_date": expiry,
+            "complete": df["complete"].apply(clean_text),
+            "keep_or_dump": df["keep_or_dump"].apply(clean_text),
+        })
+
+        # Keep ONLY rows that actually have a Work Order
+        out = out[out["work_order"].apply(has_work_order)]
+
+        # Drop rows that are totally empty otherwise (rare)
+        out = out[~(out["project"].isna() & out["engineer"].isna() & out["report_submission_date"].isna() & out["storage_expiry_date"].isna())]
+
+        frames.append(out)
+
+    print(f"✅ Sheets loaded: {xls.sheet_names}")
+    return frames
+
+# ------------- Pick one row per (island, Work Order) (most recent) -------------
+def best_rows(df_all):
+    # "Row date" = most recent of submission/expiry; rows with any date beat rows with no dates
+    row_date = pd.concat(
+        [df_all["report_submission_date"], df_all["storage_expiry_date"]],
+        axis=1
+    ).max(axis=1)  # max handles NaT: returns the valid one if any; NaT if both NaT
+
+    df_all["__row_date"] = row_date
+    df_all["__has_date"] = df_all["__row_date"].notna()
+
+    # Optional tie-breaker: prefer Dump over Keep over Save when dates tie
+    keep_rank_map = {"dump": 3, "keep": 2, "save": 1}
+    df_all["__keep_rank"] = df_all["keep_or_dump"].str.strip().str.lower().map(keep_rank_map).fillna(0)
+
+    # Sort: has_date(desc), row_date(desc), keep_rank(desc) then drop duplicates by island + work_order
+    df_all_sorted = df_all.sort_values(
+        by=["__has_date", "__row_date", "__keep_rank"],
+        ascending=[False, False, False],
+        kind="mergesort"  # stable
+    )
+
+    best = df_all_sorted.drop_duplicates(subset=["island", "work_order"], keep="first").copy()
+
+    # work_order is unique in the table; a W.O. listed under two islands keeps its best row only
+    clash = best[best.duplicated(subset=["work_order"], keep="first")]
+    for _, r in clash.iterrows():
+        print(f"⚠️ W.O. {r['work_order']} also listed under {r['island']}; keeping the more recent row")
+    best = best.drop_duplicates(subset=["work_order"], keep="first")
+
+    # Recompute year deterministically: prefer submission year else expiry year
+    best["year"] = np.where(
+        best["report_submission_date"].notna(),
+        best["report_submission_date"].dt.year,
+        best["storage_expiry_date"].dt.year
+    )
+
+    # ------------- Final formatting -------------
+    for dc in ["report_submission_date", "storage_expiry_date"]:
+        best[dc] = best[dc].dt.strftime("%Y-%m-%d")
+
+    return best[FINAL_COLS].copy()
+
+def to_records(final_df):
+    """Plain Python values (None for NaN, int years) so rows compare equal to what SQLite returns."""
+    records = []
+    for r in final_df.astype(object).where(final_df.notna(), None).to_dict("records"):
+        if r["year"] is not None:
+            r["year"] = int(r["year"])
+        records.append(r)
+    return records
 
 # ------------- Write to SQLite -------------
-os.makedirs(DB_DIR, exist_ok=True)
-conn = sqlite3.connect(DB_PATH)
-cur = conn.cursor()
-
-cur.execute(f"""
-CREATE TABLE IF NOT EXISTS {TABLE} (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    year INTEGER,
-    island TEXT CHECK(island IN ('Hawaii', 'Maui')),
-    work_order TEXT,
-    project TEXT,
-    engineer TEXT,
-    report_submission_date TEXT,
-    storage_expiry_date TEXT,
-    complete TEXT,
-    keep_or_dump TEXT
-)
-""")
-
-# Rebuild table by default
-if WRITE_MODE == "replace":
-    cur.execute(f"DELETE FROM {TABLE}")
-
-final_df.to_sql(TABLE, conn, if_exists="append", index=False)
-
-# Helpful indexes (and uniqueness on work_order for safety)
-cur.executescript(f"""
-CREATE UNIQUE INDEX IF NOT EXISTS uq_core_work_order ON {TABLE}(work_order);
-CREATE INDEX IF NOT EXISTS idx_core_year      ON {TABLE}(year);
-CREATE INDEX IF NOT EXISTS idx_core_island    ON {TABLE}(island);
-CREATE INDEX IF NOT EXISTS idx_core_submitted ON {TABLE}(report_submission_date);
-CREATE INDEX IF NOT EXISTS idx_core_expiry    ON {TABLE}(storage_expiry_date);
-""")
-
-conn.commit()
-conn.close()
-
-print(f"✅ Sheets loaded: {xls.sheet_names}")
-print(f"✅ Final rows (unique by work_order): {len(final_df)}")
-print(f"✅ Wrote to {DB_PATH}:{TABLE}")
+def ensure_tables(cur):
+    cur.execute(f"""
+    CREATE TABLE IF NOT EXISTS {TABLE} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        year INTEGER,
+        island TEXT CHECK(island IN ('Hawaii', 'Maui')),
+        work_order TEXT,
+        project TEXT,
+        engineer TEXT,
+        report_submission_date TEXT,
+        storage_expiry_date TEXT,
+        complete TEXT,
+        keep_or_dump TEXT
+    )
+    """)
+    # same audit table the web app writes (core_box_inventory.ensure_core_tables)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS core_boxes_changes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        action TEXT,
+        core_box_id INTEGER,
+        work_order TEXT,
+        user TEXT,
+        ts TEXT,
+        old_snapshot TEXT,
+        new_snapshot TEXT
+    )
+    """)
+    # Each W.O.'s workbook row as of the last import: sync compares against this, not the live
+    # row, so edits made in the web app aren't mistaken for workbook changes
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS core_boxes_import_state (
+        work_order TEXT PRIMARY KEY,
+        snapshot TEXT,      -- JSON of FINAL_COLS
+        synced_at TEXT
+    )
+    """)
+
+def save_baselines(cur, records, ts):
+    cur.executemany(
+        "INSERT OR REPLACE INTO core_boxes_import_state (work_order, snapshot, synced_at) VALUES (?, ?, ?)",
+        [(r["work_order"], json.dumps(r), ts) for r in records])
+
+def create_indexes(cur):
+    # Helpful indexes (and uniqueness on work_order for safety)
+    cur.executescript(f"""
+    CREATE UNIQUE INDEX IF NOT EXISTS uq_core_work_order ON {TABLE}(work_order);
+    CREATE INDEX IF NOT EXISTS idx_core_year      ON {TABLE}(year);
+    CREATE INDEX IF NOT EXISTS idx_core_island    ON {TABLE}(island);
+    CREATE INDEX IF NOT EXISTS idx_core_submitted ON {TABLE}(report_submission_date);
+    CREATE INDEX IF NOT EXISTS idx_core_expiry    ON {TABLE}(storage_expiry_date);
+    """)
+
+def sync_rows(conn, records, islands):
+    """
+    Upsert per (island, work_order). New W.O.s are inserted. For existing ones, only the fields
+    whose workbook value changed since the last import are written, so web-app edits to other
+    fields survive; a workbook row identical to last time touches nothing. Rows with no import
+    baseline (older imports) are overwritten unless someone else has edited them since.
+    Every write gets a core_boxes_changes row. Returns counts.
+    """
+    cur = conn.cursor()
+    cur.row_factory = sqlite3.Row
+    existing = {r["work_order"]: r for r in cur.execute(f"SELECT * FROM {TABLE}")}
+    baselines = {r["work_order"]: json.loads(r["snapshot"])
+                 for r in cur.execute("SELECT work_order, snapshot FROM core_boxes_import_state")}
+    # W.O.s whose latest audit entry came from someone other than the importer
+    edited_elsewhere = {r["work_order"] for r in cur.execute("""
+        SELECT c.work_order, c.user FROM core_boxes_changes c
+        JOIN (SELECT work_order, MAX(id) AS id FROM core_boxes_changes GROUP BY work_order) last
+          ON last.id = c.id
+    """) if r["user"] != IMPORT_USER}
+    ts = datetime.utcnow().isoformat()
+    stats = {"created": 0, "updated": 0, "unchanged": 0, "kept_edits": 0, "conflicts": 0}
+    updates, audits, baseline_rows = [], [], []
+    cols = ",".join(FINAL_COLS)
+    marks = ",".join(":" + c for c in FINAL_COLS)
+
+    for rec in records:
+        old = existing.pop(rec["work_order"], None)
+        base = baselines.get(rec["work_order"])
+        if old is None:
+            new_id = cur.execute(f"INSERT INTO {TABLE} ({cols}) VALUES ({marks})", rec).lastrowid
+            audits.append(("create", new_id, rec["work_order"], IMPORT_USER, ts, None, json.dumps(rec)))
+            baseline_rows.append(rec)
+            stats["created"] += 1
+            continue
+        if old["island"] != rec["island"]:
+            print(f"⚠️ W.O. {rec['work_order']} is already in the inventory under {old['island']}; "
+                  f"skipping the {rec['island']} row")
+            stats["conflicts"] += 1
+            continue
+        if base is not None and all(base.get(c) == rec[c] for c in FINAL_COLS):
+            stats["unchanged"] += 1   # workbook row as last imported; the DB row may carry web edits
+            continue
+
+        baseline_rows.append(rec)
+        if base is not None:
+            # three-way: take the workbook's value only where the workbook itself changed
+            new = {c: rec[c] if base.get(c) != rec[c] else old[c] for c in FINAL_COLS}
+        elif rec["work_order"] in edited_elsewhere:
+            new = dict(old)   # no baseline to tell workbook changes from web edits: keep the edits
+        else:
+            new = dict(rec)
+        new = {c: new[c] for c in FINAL_COLS}
+        if any(old[c] != new[c] for c in FINAL_COLS):
+            updates.append({**new, "id": old["id"]})
+            audits.append(("update", old["id"], rec["work_order"], IMPORT_USER, ts,
+                           json.dumps(dict(old)), json.dumps(new)))
+            stats["updated"] += 1
+        if any(new[c] != rec[c] for c in FINAL_COLS):
+            stats["kept_edits"] += 1
+        elif not any(old[c] != new[c] for c in FINAL_COLS):
+            stats["unchanged"] += 1
+
+    cur.executemany(
+        f"UPDATE {TABLE} SET {', '.join(f'{c}=:{c}' for c in FINAL_COLS)} WHERE id=:id", updates)
+    cur.executemany("""
+        INSERT INTO core_boxes_changes (action, core_box_id, work_order, user, ts, old_snapshot, new_snapshot)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, audits)
+    save_baselines(cur, baseline_rows, ts)
+
+    # Not in any workbook: kept (web-created rows, older entries); just report them
+    stats["not_in_workbooks"] = sum(1 for r in existing.values() if r["island"] in islands)
+    return stats
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Import core box inventory workbooks into SQLite.")
+    parser.add_argument("workbooks", nargs="*", metavar="FILE=ISLAND",
+                        help="Workbook and its island tag (default: WORKBOOKS in this file)")
+    parser.add_argument("--mode", choices=["sync", "replace", "append"], default=WRITE_MODE)
+    parser.add_argument("--db", default=DB_PATH)
+    args = parser.parse_args()
+    books = []
+    for spec in args.workbooks:
+        path, sep, island = spec.rpartition("=")
+        if not sep or not path or not island:
+            parser.error(f"expected FILE=ISLAND, got {spec!r}")
+        books.append((path, island))
+    return books or WORKBOOKS, args.mode, args.db
+
+def main():
+    workbooks, mode, db_path = parse_args()
+
+    frames = []
+    for xlsx_file, island in workbooks:
+        frames += load_workbook(xlsx_file, island)
+    if not frames:
+        raise SystemExit("❌ No usable sheets found.")
+
+    final_df = best_rows(pd.concat(frames, ignore_index=True))
+    islands = sorted({island for _, island in workbooks})
+
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    cur = conn.cursor()
+    ensure_tables(cur)
+
+    if mode == "sync":
+        create_indexes(cur)
+        stats = sync_rows(conn, to_records(final_df), islands)
+        conn.commit()
+        conn.close()
+        print(f"✅ Synced {len(final_df)} rows for {', '.join(islands)} into {db_path}:{TABLE} | "
+              f"{stats['created']} created, {stats['updated']} updated, {stats['unchanged']} unchanged, "
+              f"{stats['kept_edits']} with web edits kept, {stats['conflicts']} conflicts, {stats['not_in_workbooks']} in DB but not in the workbooks (kept)")
+        return
+
+    # Rebuild table
+    if mode == "replace":
+        cur.execute(f"DELETE FROM {TABLE}")
+        cur.execute("DELETE FROM core_boxes_import_state")
+
+    final_df.to_sql(TABLE, conn, if_exists="append", index=False)
+    create_indexes(cur)
+    save_baselines(cur, to_records(final_df), datetime.utcnow().isoformat())
+
+    conn.commit()
+    conn.close()
+
+    print(f"✅ Final rows (unique by work_order): {len(final_df)}")
+    print(f"✅ Wrote to {db_path}:{TABLE}")
+
+if __name__ == "__main__":
+    main()
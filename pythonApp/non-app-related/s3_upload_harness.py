@@ -0,0 +1,99 @@
+# s3_upload_harness.py
+# Exercises s3_storage uploads against an in-memory S3 (moto), no AWS account needed.
+# Run from pythonApp/:  pip install moto  &&  python non-app-related/s3_upload_harness.py
+import os
+import sys
+import time
+import hashlib
+import tempfile
+
+from moto import mock_aws
+
+# Fake credentials/bucket before boto3 is imported anywhere
+os.environ.update({
+    "AWS_ACCESS_KEY_ID": "testing",
+    "AWS_SECRET_ACCESS_KEY": "testing",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "S3_PDF_BUCKET": "harness-db-pdfs",
+})
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# ============== CONFIG ==============
+LARGE_MB = 40             # well above the multipart threshold
+SMALL_KB = 200            # single PUT
+CONCURRENT_FILES = 6
+FAKE_INDEX_SECONDS = 1.0  # stands in for extraction/embedding in run_process_file
+# ====================================
+
+failures = []
+
+def check(ok, label):
+    print(f"{'✅' if ok else '❌'} {label}")
+    if not ok:
+        failures.append(label)
+
+def make_file(directory, name, size):
+    path = os.path.join(directory, name)
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n" + os.urandom(size))
+    return path
+
+def sha(data):
+    return hashlib.sha256(data).hexdigest()
+
+def main():
+    with mock_aws(), tempfile.TemporaryDirectory() as tmp:
+        import s3_storage
+        from s3_storage import S3_BUCKET, S3_TRANSFER, s3, upload_pdf_to_s3, upload_pdf_to_s3_async
+        s3.create_bucket(Bucket=S3_BUCKET)
+        print(f"🪣 moto bucket '{S3_BUCKET}', multipart over {S3_TRANSFER.multipart_threshold // s3_storage.MB} MB "
+              f"in {S3_TRANSFER.multipart_chunksize // s3_storage.MB} MB parts x{S3_TRANSFER.max_concurrency}")
+
+        # 1) large file goes up as multipart, content intact
+        large = make_file(tmp, "large.pdf", LARGE_MB * s3_storage.MB)
+        start = time.perf_counter()
+        key, url = upload_pdf_to_s3(large, "harness.db", "large.pdf")
+        elapsed = time.perf_counter() - start
+        head = s3.head_object(Bucket=S3_BUCKET, Key=key)
+        body = s3.get_object(Bucket=S3_BUCKET, Key=key)["Body"].read()
+        with open(large, "rb") as f:
+            local = f.read()
+        check(key == "harness.db/large.pdf" and bool(url), f"large upload returned key + presigned URL ({elapsed:.2f}s)")
+        check("-" in head["ETag"], f"large upload was multipart (ETag {head['ETag']})")
+        check(head["ContentType"] == "application/pdf", "ContentType is application/pdf")
+        check(sha(body) == sha(local), "large object content matches")
+
+        # 2) small file is a single PUT
+        small = make_file(tmp, "small.pdf", SMALL_KB * 1024)
+        key, _ = upload_pdf_to_s3(small, "harness.db", "small.pdf", prefix="sub")
+        head = s3.head_object(Bucket=S3_BUCKET, Key=key)
+        check(key == "harness.db/sub/small.pdf" and "-" not in head["ETag"], "small upload is a single PUT under prefix")
+
+        # 3) upload overlaps "indexing" the way run_process_file uses it
+        start = time.perf_counter()
+        future = upload_pdf_to_s3_async(large, "harness.db", "overlap.pdf")
+        time.sleep(FAKE_INDEX_SECONDS)
+        key, url = future.result()
+        overlapped = time.perf_counter() - start
+        check(key is not None, f"async upload finished alongside indexing: {overlapped:.2f}s total "
+                               f"vs ~{elapsed + FAKE_INDEX_SECONDS:.2f}s sequential")
+
+        # 4) several uploads share the pool
+        paths = [make_file(tmp, f"doc{i}.pdf", 2 * s3_storage.MB) for i in range(CONCURRENT_FILES)]
+        futures = [upload_pdf_to_s3_async(p, "harness.db", os.path.basename(p)) for p in paths]
+        keys = [f.result()[0] for f in futures]
+        listed = {o["Key"] for o in s3.list_objects_v2(Bucket=S3_BUCKET, Prefix="harness.db/doc")["Contents"]}
+        check(set(keys) == listed and len(listed) == CONCURRENT_FILES, f"{CONCURRENT_FILES} concurrent uploads all landed")
+
+        # 5) failures come back as (None, None) instead of raising into the job
+        s3_storage.S3_BUCKET = "missing-bucket"
+        key, url = upload_pdf_to_s3(small, "harness.db", "nowhere.pdf")
+        s3_storage.S3_BUCKET = S3_BUCKET
+        check(key is None and url is None, "upload to a missing bucket returns (None, None)")
+
+    if failures:
+        raise SystemExit(f"❌ {len(failures)} check(s) failed")
+    print("🎉 All S3 upload checks passed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# page_cache.py
+import os
+import time
+import hashlib
+import threading
+
+from db_pool import connect
+
+# ---------------------- CONFIG ----------------------
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, "uploads", "cache")
+CACHE_DB = os.path.join(CACHE_DIR, "page_text.sqlite3")
+MAX_BYTES = int(os.environ.get("PAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+EVICT_TO = 0.9          # evict down to 90% of MAX_BYTES once over the cap
+NATIVE_DPI = 0          # native text doesn't depend on render DPI
+
+_init_lock = threading.Lock()
+_ready = False
+_stats = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0}
+
+# ---------------------- DB bootstrap ----------------------
+def _ensure():
+    global _ready
+    if _ready:
+        return
+    with _init_lock:
+        if _ready:
+            return
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with connect(CACHE_DB) as conn:
+            conn.executescript("""
+            CREATE TABLE IF NOT EXISTS page_text (
+                pdf_sha TEXT,
+                page INTEGER,
+                dpi INTEGER,          -- 0 for native text
+                source TEXT,          -- 'native' | 'ocr'
+                text TEXT,
+                bytes INTEGER,
+                created_at REAL,
+                last_used REAL,
+                PRIMARY KEY (pdf_sha, page, dpi)
+            );
+            CREATE INDEX IF NOT EXISTS idx_page_text_lru ON page_text(last_used);
+            """)
+        _ready = True
+
+# ---------------------- Helpers ----------------------
+def file_sha256(path, block_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def load_pages(pdf_sha, dpi):
+    """{page_index: (source, text)} for every cached page of this PDF at this DPI (or native)."""
+    _ensure()
+    with connect(CACHE_DB) as conn:
+        rows = conn.execute("""
+            SELECT page, source, text FROM page_text
+            WHERE pdf_sha = ? AND dpi IN (?, ?)
+        """, (pdf_sha, NATIVE_DPI, dpi)).fetchall()
+        if rows:
+            conn.execute("UPDATE page_text SET last_used = ? WHERE pdf_sha = ?", (time.time(), pdf_sha))
+    _stats["hits"] += len(rows)
+    return {page: (source, text) for page, source, text in rows}
+
+def store_pages(pdf_sha, dpi, pages):
+    """pages: [(page_index, source, text)]; native pages are stored DPI-independent."""
+    if not pages:
+        return
+    _ensure()
+    now = time.time()
+    rows = [
+        (pdf_sha, page, NATIVE_DPI if source == "native" else dpi, source, text,
+         len(text.encode("utf-8")), now, now)
+        for page, source, text in pages
+    ]
+    with connect(CACHE_DB) as conn:
+        conn.executemany("""
+            INSERT OR REPLACE INTO page_text (pdf_sha, page, dpi, source, text, bytes, created_at, last_used)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+    _stats["stored"] += len(rows)
+    _stats["misses"] += len(rows)
+    evict()
+
+def evict(max_bytes=MAX_BYTES):
+    """Drop least-recently-used pages until the cache is back under EVICT_TO * max_bytes."""
+    _ensure()
+    with connect(CACHE_DB) as conn:
+        total = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM page_text").fetchone()[0]
+        if total <= max_bytes:
+            return 0
+        target = total - int(max_bytes * EVICT_TO)
+        freed, victims = 0, []
+        for rowid, size in conn.execute("SELECT rowid, bytes FROM page_text ORDER BY last_used"):
+            victims.append((rowid,))
+            freed += size or 0
+            if freed >= target:
+                break
+        conn.executemany("DELETE FROM page_text WHERE rowid = ?", victims)
+    _stats["evicted"] += len(victims)
+    print(f"🧹 Page cache evicted {len(victims)} pages ({freed} bytes)")
+    return len(victims)
+
+def cache_stats():
+    _ensure()
+    with connect(CACHE_DB) as conn:
+        entries, size, docs = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(bytes), 0), COUNT(DISTINCT pdf_sha) FROM page_text"
+        ).fetchone()
+        by_source = dict(conn.execute("SELECT source, COUNT(*) FROM page_text GROUP BY source").fetchall())
+    return {
+        "db_path": CACHE_DB,
+        "entries": entries,
+        "documents": docs,
+        "bytes": size,
+        "max_bytes": MAX_BYTES,
+        "by_source": by_source,
+        **_stats,
+    }
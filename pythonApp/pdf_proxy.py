@@ -0,0 +1,233 @@
+# pdf_proxy.py
+import os
+import time
+import hashlib
+import threading
+import unicodedata
+from urllib.parse import quote
+
+from botocore.exceptions import ClientError
+from flask import Blueprint, request, jsonify, send_file, Response
+from werkzeug.exceptions import HTTPException
+
+from db_pool import connect
+from s3_storage import s3, S3_BUCKET, S3_TRANSFER
+import s3_catalog
+
+pdf_proxy_bp = Blueprint("pdf_proxy", __name__)
+
+# ---------------------- CONFIG ----------------------
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, "uploads", "cache")
+PDF_DIR = os.path.join(CACHE_DIR, "pdf")
+INDEX_DB = os.path.join(CACHE_DIR, "pdf_cache.sqlite3")
+MAX_BYTES = int(os.environ.get("PDF_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+MAX_OBJECT_BYTES = MAX_BYTES // 4   # bigger objects are proxied but never cached
+EVICT_TO = 0.9                      # evict down to 90% of MAX_BYTES once over the cap
+STREAM_CHUNK = 256 * 1024
+
+_init_lock = threading.Lock()
+_ready = False
+_filling = set()                    # cache names being downloaded right now
+_filling_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "range_misses": 0, "filled": 0, "evicted": 0, "fill_errors": 0}
+
+# ---------------------- DB bootstrap ----------------------
+def _ensure():
+    global _ready
+    if _ready:
+        return
+    with _init_lock:
+        if _ready:
+            return
+        os.makedirs(PDF_DIR, exist_ok=True)
+        with connect(INDEX_DB) as conn:
+            conn.executescript("""
+            CREATE TABLE IF NOT EXISTS pdf_cache (
+                name TEXT PRIMARY KEY,    -- sha256 of bucket/key, also the file name
+                bucket TEXT,
+                key TEXT,
+                etag TEXT,
+                bytes INTEGER,
+                created_at REAL,
+                last_used REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_pdf_cache_lru ON pdf_cache(last_used);
+            """)
+        _ready = True
+
+# ---------------------- Cache ----------------------
+def cache_name(bucket, key):
+    return hashlib.sha256(f"{bucket}/{key}".encode("utf-8")).hexdigest()
+
+def _path(name):
+    return os.path.join(PDF_DIR, name + ".pdf")
+
+def lookup(bucket, key):
+    """(path, etag) of a cached copy that still matches the catalog's ETag, else None."""
+    _ensure()
+    name = cache_name(bucket, key)
+    with connect(INDEX_DB) as conn:
+        row = conn.execute("SELECT etag FROM pdf_cache WHERE name = ?", (name,)).fetchone()
+        if not row or not os.path.exists(_path(name)):
+            return None
+        current = s3_catalog.catalog_for(bucket).etag(key)
+        if current and current != row[0]:
+            return None
+        conn.execute("UPDATE pdf_cache SET last_used = ? WHERE name = ?", (time.time(), name))
+    return _path(name), row[0]
+
+def fill(bucket, key):
+    """Download the whole object into the cache (multipart, parallel parts); no-op if already running."""
+    _ensure()
+    name = cache_name(bucket, key)
+    with _filling_lock:
+        if name in _filling:
+            return
+        _filling.add(name)
+    tmp = _path(name) + f".{threading.get_ident()}.part"
+    try:
+        head = s3.head_object(Bucket=bucket, Key=key)
+        size = head.get("ContentLength", 0)
+        if size > MAX_OBJECT_BYTES:
+            return
+        s3.download_file(bucket, key, tmp, Config=S3_TRANSFER)
+        os.replace(tmp, _path(name))
+        now = time.time()
+        with connect(INDEX_DB) as conn:
+            conn.execute("INSERT OR REPLACE INTO pdf_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (name, bucket, key, head.get("ETag", "").strip('"'), size, now, now))
+        _stats["filled"] += 1
+        evict()
+    except Exception as e:
+        _stats["fill_errors"] += 1
+        print(f"⚠️ PDF cache fill failed for {key}:", e)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        with _filling_lock:
+            _filling.discard(name)
+
+def fill_in_background(bucket, key):
+    threading.Thread(target=fill, args=(bucket, key), name="pdf-cache-fill", daemon=True).start()
+
+def evict(max_bytes=MAX_BYTES):
+    """Drop least-recently-viewed PDFs until the cache is back under EVICT_TO * max_bytes."""
+    _ensure()
+    with connect(INDEX_DB) as conn:
+        total = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM pdf_cache").fetchone()[0]
+        if total <= max_bytes:
+            return 0
+        target = total - int(max_bytes * EVICT_TO)
+        freed, victims = 0, []
+        for name, size in conn.execute("SELECT name, bytes FROM pdf_cache ORDER BY last_used"):
+            victims.append((name,))
+            freed += size or 0
+            if freed >= target:
+                break
+        conn.executemany("DELETE FROM pdf_cache WHERE name = ?", victims)
+    for (name,) in victims:
+        try:
+            os.remove(_path(name))
+        except OSError:
+            pass
+    _stats["evicted"] += len(victims)
+    print(f"🧹 PDF cache evicted {len(victims)} files ({freed} bytes)")
+    return len(victims)
+
+def cache_stats():
+    _ensure()
+    with connect(INDEX_DB) as conn:
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM pdf_cache").fetchone()
+    return {"dir": PDF_DIR, "entries": entries, "bytes": size, "max_bytes": MAX_BYTES,
+            "filling": len(_filling), **_stats}
+
+# ---------------------- Proxying ----------------------
+def _inline_filename(resp, name):
+    """Same Content-Disposition send_file() builds, including non-ASCII names."""
+    try:
+        resp.headers.set("Content-Disposition", "inline", filename=name.encode("ascii").decode("ascii"))
+    except UnicodeEncodeError:
+        ascii_name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+        resp.headers.set("Content-Disposition", "inline", filename=ascii_name,
+                         **{"filename*": f"UTF-8''{quote(name, safe='')}"})
+
+def _stream_from_s3(bucket, key, byte_range=None):
+    """Pass-through for cache misses: the first bytes reach the viewer while the cache fills."""
+    args = {"Bucket": bucket, "Key": key}
+    if byte_range:
+        args["Range"] = byte_range
+    obj = s3.get_object(**args)
+    body = obj["Body"]
+
+    def generate():
+        try:
+            for chunk in body.iter_chunks(STREAM_CHUNK):
+                yield chunk
+        finally:
+            body.close()
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Length": str(obj.get("ContentLength", "")),
+        "Cache-Control": "private, max-age=3600",
+    }
+    if obj.get("ETag"):
+        headers["ETag"] = obj["ETag"]
+    status = 200
+    if byte_range and obj.get("ContentRange"):
+        headers["Content-Range"] = obj["ContentRange"]
+        status = 206
+    resp = Response(generate(), status=status, mimetype="application/pdf", headers=headers)
+    _inline_filename(resp, os.path.basename(key))
+    return resp
+
+# ---------------------- Routes ----------------------
+@pdf_proxy_bp.route("/api/s3/pdf", methods=["GET"])
+def proxy_pdf():
+    """
+    GET /api/s3/pdf?key=<key>[&bucket=<bucket>]
+    Honors Range / If-None-Match. Cached copies are served from disk; misses stream
+    from S3 (only the requested range, if any) and fill the cache in the background.
+    """
+    key = request.args.get("key", "")
+    bucket = request.args.get("bucket") or S3_BUCKET
+    if not key:
+        return jsonify({"error": "Missing key"}), 400
+    if bucket not in s3_catalog.BUCKETS:
+        return jsonify({"error": f"Unknown bucket: {bucket}"}), 400
+
+    try:
+        cached = lookup(bucket, key)
+        if cached:
+            _stats["hits"] += 1
+            path, etag = cached
+            return send_file(path, mimetype="application/pdf", conditional=True, etag=etag or True,
+                             download_name=os.path.basename(key), max_age=3600)
+
+        byte_range = request.headers.get("Range")
+        if byte_range and "," in byte_range:
+            byte_range = None   # multi-range: send the whole file
+        _stats["range_misses" if byte_range else "misses"] += 1
+        resp = _stream_from_s3(bucket, key, byte_range)
+        fill_in_background(bucket, key)
+        return resp
+    except HTTPException:
+        raise   # e.g. 416 from send_file for an unsatisfiable range
+    except s3.exceptions.NoSuchKey:
+        return jsonify({"error": f"Not found: {key}"}), 404
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") == "InvalidRange":
+            return Response(status=416)
+        print("❌ PDF proxy error:", e)
+        return jsonify({"error": str(e)}), 500
+    except Exception as e:
+        print("❌ PDF proxy error:", e)
+        return jsonify({"error": str(e)}), 500
+
+@pdf_proxy_bp.route("/api/s3/pdf-cache/stats", methods=["GET"])
+def pdf_cache_stats():
+    try:
+        return jsonify(cache_stats())
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
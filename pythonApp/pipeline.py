@@ -0,0 +1,92 @@
+# pipeline.py
+import queue
+import threading
+
+# ---------------------- CONFIG ----------------------
+POLL_S = 0.1        # how often blocked puts/gets re-check for a stop request
+
+_ITEM, _DONE, _ERROR = "item", "done", "error"
+
+
+class Stage:
+    """
+    Runs an iterable on its own daemon thread and hands its items over through a
+    bounded queue, so a slow consumer makes the producer wait instead of piling up.
+
+    Chain stages by passing one as the next one's source (and as `upstream`):
+        pages  = Stage(iter_pages(), maxsize=8, name="extract")
+        chunks = Stage(chunker(pages), maxsize=32, name="chunk", upstream=pages)
+    Errors raised in a stage are re-raised in whoever iterates it; close() stops the
+    stage and everything upstream of it.
+    """
+
+    def __init__(self, source, maxsize=4, name="stage", upstream=None):
+        self.name = name
+        self.upstream = upstream
+        self._source = source
+        self._queue = queue.Queue(maxsize=max(1, maxsize))
+        self._stop = threading.Event()
+        self._finished = False
+        self._thread = threading.Thread(target=self._run, name=f"pipeline-{name}", daemon=True)
+        self._thread.start()
+
+    # ---------------------- producer thread ----------------------
+    def _put(self, entry):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(entry, timeout=POLL_S)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self):
+        try:
+            for item in self._source:
+                if not self._put((_ITEM, item)):
+                    return
+            self._put((_DONE, None))
+        except BaseException as e:
+            self._put((_ERROR, e))
+        finally:
+            close = getattr(self._source, "close", None)
+            if close:
+                try:
+                    close()
+                except Exception as e:
+                    print(f"⚠️ Pipeline stage '{self.name}' did not close cleanly:", e)
+
+    # ---------------------- consumer side ----------------------
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while not self._finished:
+            try:
+                kind, item = self._queue.get(timeout=POLL_S)
+            except queue.Empty:
+                if self._stop.is_set():
+                    break
+                continue
+            if kind == _ITEM:
+                return item
+            self._finished = True
+            self._thread.join()
+            if kind == _ERROR:
+                raise item
+        raise StopIteration
+
+    def close(self):
+        """Stop this stage and its upstream; waits for the item in progress to finish."""
+        self._stop.set()
+        self._finished = True
+        if self.upstream is not None:
+            self.upstream.close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -1,8 +1,8 @@
 # reports_binder.py
 import os
-import sqlite3
 from datetime import datetime
 from flask import Blueprint, request, jsonify
+from db_pool import connect
 
 reports_binder_bp = Blueprint("reports_binder_bp", __name__, url_prefix="/api/reports-binder")
 
@@ -19,7 +19,7 @@ SORTABLE_COLS = {
 
 # ---------- DB helpers ----------
 def get_conn():
-    return sqlite3.connect(DB_PATH)
+    return connect(DB_PATH)
 
 def init_reports_db():
     with get_conn() as conn:
@@ -38,8 +38,41 @@ def init_reports_db():
         conn.execute("CREATE INDEX IF NOT EXISTS idx_reports_wo ON reports(work_order);")
         conn.execute("CREATE INDEX IF NOT EXISTS idx_reports_date ON reports(date);")
         conn.execute("CREATE INDEX IF NOT EXISTS idx_reports_billing ON reports(billing);")
+        # NOCASE so `engineer_initials LIKE 'GS%'` (case-insensitive) can range-scan it
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_reports_eng ON reports(engineer_initials COLLATE NOCASE);")
+        init_reports_fts(conn)
         conn.commit()
 
+def init_reports_fts(conn):
+    """Trigram FTS5 index over the searchable columns, synced by triggers; built from existing rows once."""
+    existed = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'reports_fts'"
+    ).fetchone()
+    conn.executescript("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS reports_fts USING fts5(
+        pdf_file, work_order, engineer_initials, billing,
+        content='reports', content_rowid='id', tokenize='trigram'
+    );
+    CREATE TRIGGER IF NOT EXISTS trg_reports_fts_ins AFTER INSERT ON reports BEGIN
+        INSERT INTO reports_fts(rowid, pdf_file, work_order, engineer_initials, billing)
+        VALUES (new.id, new.pdf_file, new.work_order, new.engineer_initials, new.billing);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_reports_fts_del AFTER DELETE ON reports BEGIN
+        INSERT INTO reports_fts(reports_fts, rowid, pdf_file, work_order, engineer_initials, billing)
+        VALUES ('delete', old.id, old.pdf_file, old.work_order, old.engineer_initials, old.billing);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_reports_fts_upd
+    AFTER UPDATE OF pdf_file, work_order, engineer_initials, billing ON reports BEGIN
+        INSERT INTO reports_fts(reports_fts, rowid, pdf_file, work_order, engineer_initials, billing)
+        VALUES ('delete', old.id, old.pdf_file, old.work_order, old.engineer_initials, old.billing);
+        INSERT INTO reports_fts(rowid, pdf_file, work_order, engineer_initials, billing)
+        VALUES (new.id, new.pdf_file, new.work_order, new.engineer_initials, new.billing);
+    END;
+    """)
+    if not existed:
+        conn.execute("INSERT INTO reports_fts(reports_fts) VALUES ('rebuild')")
+        print("✅ reports_binder: search index built")
+
 def _bool_param(x):
     if isinstance(x, bool):
         return x
@@ -53,6 +86,34 @@ def _safe_sort(sort_by, sort_dir):
     direction = "ASC" if str(sort_dir or "").upper() == "ASC" else "DESC"
     return col, direction
 
+FTS_MIN_TERM = 3   # trigram tokens: shorter strings can't use reports_fts
+
+def _fts_phrase(term):
+    return '"' + term.replace('"', '""') + '"'
+
+def _search_filters(q, eng):
+    """
+    WHERE clauses + params for the free-text box and the initials filter.
+    q: the whole string appears (substring, any case) in file/W.O./initials/billing.
+    eng: initials starting with eng. Both use reports_fts when the text is long enough.
+    """
+    where, params, match = [], [], []
+    if len(q) >= FTS_MIN_TERM:
+        match.append(_fts_phrase(q))
+    elif q:
+        like = f"%{q}%"
+        where.append("(pdf_file LIKE ? OR work_order LIKE ? OR engineer_initials LIKE ? OR billing LIKE ?)")
+        params += [like, like, like, like]
+    if len(eng) >= FTS_MIN_TERM:
+        match.append("engineer_initials : ^" + _fts_phrase(eng))
+    elif eng:
+        where.append("engineer_initials LIKE ?")   # idx_reports_eng
+        params.append(f"{eng}%")
+    if match:
+        where.insert(0, "id IN (SELECT rowid FROM reports_fts WHERE reports_fts MATCH ?)")
+        params.insert(0, " AND ".join(match))
+    return where, params
+
 def _row_to_obj(row):
     return {
         "id": row[0],
@@ -91,22 +152,12 @@ def list_reports():
     except Exception:
         page_size = 25
 
-    where = []
-    params = []
-
-    if q:
-        like = f"%{q}%"
-        where.append("(pdf_file LIKE ? OR work_order LIKE ? OR engineer_initials LIKE ? OR billing LIKE ?)")
-        params += [like, like, like, like]
+    where, params = _search_filters(q, eng)
 
     if wo:
         where.append("work_order LIKE ?")
         params.append(f"{wo}%")
 
-    if eng:
-        where.append("UPPER(engineer_initials) LIKE ?")
-        params.append(f"{eng.upper()}%")
-
     if billing_only:
         where.append("(billing IS NOT NULL AND TRIM(billing) <> '')")
 
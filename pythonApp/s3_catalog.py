@@ -0,0 +1,411 @@
+# s3_catalog.py
+import os
+import time
+import threading
+from urllib.parse import quote
+
+from flask import Blueprint, request, jsonify, redirect, url_for
+
+from db_pool import connect
+from s3_storage import s3, S3_BUCKET
+
+s3_catalog_bp = Blueprint("s3_catalog", __name__)
+
+# ---------------------- CONFIG ----------------------
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, "uploads", "cache")
+CATALOG_DB = os.path.join(CACHE_DIR, "s3_catalog.sqlite3")
+REPORTS_BUCKET = os.environ.get("S3_REPORTS_BUCKET", "geolabs-reports")
+# The mirror is served as-is and re-synced in the background once older than this
+CATALOG_TTL_S = float(os.environ.get("S3_CATALOG_TTL_S", "60"))
+PRESIGN_EXPIRES_S = 3600
+MAX_PAGE = 5000
+# Only these buckets can be listed or presigned through the API
+BUCKETS = (S3_BUCKET, REPORTS_BUCKET)
+
+_init_lock = threading.Lock()
+_ready = False
+
+# ---------------------- DB bootstrap ----------------------
+def _ensure():
+    global _ready
+    if _ready:
+        return
+    with _init_lock:
+        if _ready:
+            return
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with connect(CATALOG_DB) as conn:
+            conn.executescript("""
+            CREATE TABLE IF NOT EXISTS s3_objects (
+                bucket TEXT,
+                key TEXT,
+                db_prefix TEXT,       -- first path segment, e.g. 'my_docs.db'
+                name TEXT,            -- last path segment, lowercased for search
+                ext TEXT,             -- lowercased extension without the dot
+                size INTEGER,
+                etag TEXT,
+                last_modified TEXT,
+                PRIMARY KEY (bucket, key)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_s3_objects_db ON s3_objects(bucket, db_prefix, key);
+
+            CREATE TABLE IF NOT EXISTS s3_sync (
+                bucket TEXT,
+                prefix TEXT,
+                synced_at REAL,
+                objects INTEGER,
+                changed INTEGER,
+                deleted INTEGER,
+                ms REAL,
+                PRIMARY KEY (bucket, prefix)
+            );
+            """)
+        _ready = True
+
+def _object_row(bucket, key, size, etag, last_modified):
+    name = key.rstrip("/").rsplit("/", 1)[-1].lower()
+    ext = name.rsplit(".", 1)[-1] if "." in name else ""
+    db_prefix = key.split("/", 1)[0] if "/" in key else ""
+    lm = getattr(last_modified, "isoformat", lambda: str(last_modified or ""))()
+    return (bucket, key, db_prefix, name, ext, size or 0, (etag or "").strip('"'), lm)
+
+def _prefix_end(prefix):
+    """Smallest string greater than every key starting with prefix (for range scans)."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1) if prefix else None
+
+
+class S3Catalog:
+    """
+    Local SQLite mirror of one bucket (uploads/cache/s3_catalog.sqlite3).
+
+    Listings, name search and per-DB counts are indexed queries on the mirror.
+    sync() lists the bucket (or one prefix) to the end and applies only the
+    difference (new/changed ETags upserted, vanished keys deleted); it runs in
+    the background once the last sync is older than CATALOG_TTL_S, and the first
+    request for a bucket that was never synced waits for it. Uploads and deletes
+    made through this app write through with record_put()/record_delete().
+    """
+
+    def __init__(self, bucket, ttl=CATALOG_TTL_S, client=None):
+        self.bucket = bucket
+        self.ttl = ttl
+        self.client = client or s3
+        self._sync_lock = threading.Lock()
+        self._stale = False
+        self._stats = {"syncs": 0, "queries": 0, "writes_through": 0}
+
+    # ---------------------- sync ----------------------
+    def last_sync(self, prefix=""):
+        _ensure()
+        with connect(CATALOG_DB) as conn:
+            row = conn.execute("SELECT synced_at FROM s3_sync WHERE bucket = ? AND prefix = ?",
+                               (self.bucket, prefix)).fetchone()
+        return row[0] if row else None
+
+    def sync(self, prefix=""):
+        """List s3://bucket/prefix and apply the diff to the mirror; returns (objects, changed, deleted)."""
+        _ensure()
+        with self._sync_lock:
+            start = time.perf_counter()
+            self._stale = False
+            end = _prefix_end(prefix)
+            with connect(CATALOG_DB) as conn:
+                sql = "SELECT key, etag, size FROM s3_objects WHERE bucket = ? AND key >= ?"
+                args = [self.bucket, prefix]
+                if end:
+                    sql += " AND key < ?"
+                    args.append(end)
+                local = {key: (etag, size) for key, etag, size in conn.execute(sql, args)}
+
+            upserts, seen = [], set()
+            paginate = self.client.get_paginator("list_objects_v2").paginate
+            for page in paginate(Bucket=self.bucket, **({"Prefix": prefix} if prefix else {})):
+                for obj in page.get("Contents", []):
+                    key = obj["Key"]
+                    seen.add(key)
+                    row = _object_row(self.bucket, key, obj.get("Size"), obj.get("ETag"), obj.get("LastModified"))
+                    if local.get(key) != (row[6], row[5]):
+                        upserts.append(row)
+            deletes = [(self.bucket, key) for key in local.keys() - seen]
+
+            elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+            with connect(CATALOG_DB) as conn:
+                conn.executemany("INSERT OR REPLACE INTO s3_objects VALUES (?, ?, ?, ?, ?, ?, ?, ?)", upserts)
+                conn.executemany("DELETE FROM s3_objects WHERE bucket = ? AND key = ?", deletes)
+                conn.execute("INSERT OR REPLACE INTO s3_sync VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             (self.bucket, prefix, time.time(), len(seen), len(upserts), len(deletes), elapsed_ms))
+            self._stats["syncs"] += 1
+        print(f"🪣 Synced s3://{self.bucket}/{prefix}: {len(seen)} objects, "
+              f"{len(upserts)} changed, {len(deletes)} removed ({elapsed_ms} ms)")
+        return len(seen), len(upserts), len(deletes)
+
+    def _sync_in_background(self):
+        if self._sync_lock.locked():
+            return
+        def run():
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"⚠️ Background sync of s3://{self.bucket} failed:", e)
+        threading.Thread(target=run, name=f"s3-sync:{self.bucket}", daemon=True).start()
+
+    def ensure_synced(self):
+        """Blocks only if the bucket was never mirrored; otherwise refreshes stale data in the background."""
+        synced_at = self.last_sync()
+        if synced_at is None:
+            self.sync()
+        elif self._stale or time.time() - synced_at >= self.ttl:
+            self._sync_in_background()
+
+    def invalidate(self):
+        """Next request triggers a background re-sync."""
+        self._stale = True
+
+    # ---------------------- write-through ----------------------
+    def record_put(self, key, size=None, etag=None, last_modified=None):
+        """Mirror an object this app just wrote; fetches its metadata with HEAD if not given."""
+        _ensure()
+        if size is None:
+            head = self.client.head_object(Bucket=self.bucket, Key=key)
+            size, etag, last_modified = head.get("ContentLength"), head.get("ETag"), head.get("LastModified")
+        with connect(CATALOG_DB) as conn:
+            conn.execute("INSERT OR REPLACE INTO s3_objects VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         _object_row(self.bucket, key, size, etag, last_modified))
+        self._stats["writes_through"] += 1
+
+    def record_delete(self, key):
+        _ensure()
+        with connect(CATALOG_DB) as conn:
+            conn.execute("DELETE FROM s3_objects WHERE bucket = ? AND key = ?", (self.bucket, key))
+        self._stats["writes_through"] += 1
+
+    # ---------------------- queries ----------------------
+    def page(self, cursor="", limit=None, prefix="", suffix=""):
+        """Objects after `cursor` (a key) matching prefix/suffix, folders skipped; returns (items, next_cursor)."""
+        self.ensure_synced()
+        sql = ["SELECT key, size, last_modified FROM s3_objects WHERE bucket = ? AND key > ? AND key NOT LIKE '%/'"]
+        args = [self.bucket, cursor or ""]
+        if prefix:
+            sql.append("AND key >= ? AND key < ?")
+            args += [prefix, _prefix_end(prefix)]
+        if suffix:
+            sql.append("AND ext = ?")
+            args.append(suffix.lower().lstrip("."))
+        sql.append("ORDER BY key")
+        if limit is not None:
+            sql.append("LIMIT ?")
+            args.append(limit + 1)
+        with connect(CATALOG_DB) as conn:
+            rows = conn.execute(" ".join(sql), args).fetchall()
+        self._stats["queries"] += 1
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1][0]
+        return [{"Key": k, "Size": size, "LastModified": lm} for k, size, lm in rows], next_cursor
+
+    def search(self, q, db_prefix=None, limit=100):
+        """Objects whose file name contains q (case-insensitive), optionally within one DB prefix."""
+        self.ensure_synced()
+        sql = "SELECT key, size, last_modified FROM s3_objects WHERE bucket = ? AND name LIKE ? ESCAPE '\\'"
+        pattern = "%" + q.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        args = [self.bucket, pattern]
+        if db_prefix is not None:
+            sql += " AND db_prefix = ?"
+            args.append(db_prefix)
+        sql += " ORDER BY key LIMIT ?"
+        args.append(limit)
+        with connect(CATALOG_DB) as conn:
+            rows = conn.execute(sql, args).fetchall()
+        self._stats["queries"] += 1
+        return [{"Key": k, "Size": size, "LastModified": lm} for k, size, lm in rows]
+
+    def db_counts(self, suffix=""):
+        """[{ db, files, bytes }] per first path segment."""
+        self.ensure_synced()
+        sql = "SELECT db_prefix, COUNT(*), COALESCE(SUM(size), 0) FROM s3_objects WHERE bucket = ? AND key NOT LIKE '%/'"
+        args = [self.bucket]
+        if suffix:
+            sql += " AND ext = ?"
+            args.append(suffix.lower().lstrip("."))
+        sql += " GROUP BY db_prefix ORDER BY db_prefix"
+        with connect(CATALOG_DB) as conn:
+            rows = conn.execute(sql, args).fetchall()
+        self._stats["queries"] += 1
+        return [{"db": db, "files": n, "bytes": size} for db, n, size in rows]
+
+    def etag(self, key):
+        """ETag as last mirrored (None if unknown); doesn't trigger a sync."""
+        _ensure()
+        with connect(CATALOG_DB) as conn:
+            row = conn.execute("SELECT etag FROM s3_objects WHERE bucket = ? AND key = ?", (self.bucket, key)).fetchone()
+        return row[0] if row else None
+
+    def presign(self, key, expires=PRESIGN_EXPIRES_S):
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": key},
+            ExpiresIn=expires,
+        )
+
+    def stats(self):
+        _ensure()
+        with connect(CATALOG_DB) as conn:
+            objects = conn.execute("SELECT COUNT(*) FROM s3_objects WHERE bucket = ?", (self.bucket,)).fetchone()[0]
+            last = conn.execute("""
+                SELECT synced_at, objects, changed, deleted, ms FROM s3_sync
+                WHERE bucket = ? ORDER BY synced_at DESC LIMIT 1
+            """, (self.bucket,)).fetchone()
+        out = {"bucket": self.bucket, "objects": objects, "ttl_s": self.ttl, **self._stats}
+        if last:
+            out.update({"age_s": round(time.time() - last[0], 1), "last_sync": {
+                "objects": last[1], "changed": last[2], "deleted": last[3], "ms": last[4]}})
+        return out
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def catalog_for(bucket=S3_BUCKET):
+    if bucket not in BUCKETS:
+        raise KeyError(f"Unknown bucket: {bucket}")
+    with _catalogs_lock:
+        catalog = _catalogs.get(bucket)
+        if catalog is None:
+            catalog = _catalogs[bucket] = S3Catalog(bucket)
+        return catalog
+
+
+def invalidate(bucket=S3_BUCKET):
+    """Changes made outside this app (or not written through): re-sync on the next request."""
+    catalog_for(bucket).invalidate()
+
+
+def record_put(key, bucket=S3_BUCKET, **meta):
+    try:
+        catalog_for(bucket).record_put(key, **meta)
+    except Exception as e:
+        print(f"⚠️ Could not update S3 catalog for {key}:", e)
+        invalidate(bucket)
+
+
+def record_delete(key, bucket=S3_BUCKET):
+    try:
+        catalog_for(bucket).record_delete(key)
+    except Exception as e:
+        print(f"⚠️ Could not update S3 catalog for {key}:", e)
+        invalidate(bucket)
+
+# ---------------------- Route helpers ----------------------
+def listing_response(bucket, suffix=""):
+    """
+    Shared body of the listing routes: { files: [ { Key, Size, LastModified, url } ], next_cursor }.
+    Served from the local mirror. Without ?limit the whole listing is returned; with ?limit=&cursor= it's paged.
+    `url` is /api/s3/pdf for PDFs and /api/s3/presign?redirect=1 otherwise, so nothing is signed up front.
+    """
+    try:
+        limit = request.args.get("limit")
+        limit = max(1, min(MAX_PAGE, int(limit))) if limit else None
+    except ValueError:
+        limit = None
+    catalog = catalog_for(bucket)
+    items, next_cursor = catalog.page(
+        cursor=request.args.get("cursor", ""),
+        limit=limit,
+        prefix=request.args.get("prefix", ""),
+        suffix=suffix,
+    )
+    return jsonify({"files": _with_urls(bucket, items), "next_cursor": next_cursor})
+
+def _with_urls(bucket, items):
+    """PDFs open through the caching range proxy (pdf_proxy.py), anything else via a presign redirect."""
+    presign_base = url_for("s3_catalog.presign", _external=True)
+    pdf_base = url_for("pdf_proxy.proxy_pdf", _external=True)
+    bucket_q = quote(bucket, safe="")
+    out = []
+    for obj in items:
+        key = obj["Key"]
+        if key.lower().endswith(".pdf"):
+            url = f"{pdf_base}?bucket={bucket_q}&key={quote(key, safe='')}"
+        else:
+            url = f"{presign_base}?bucket={bucket_q}&key={quote(key, safe='')}&redirect=1"
+        out.append({**obj, "url": url})
+    return out
+
+def _bucket_arg():
+    bucket = request.args.get("bucket") or S3_BUCKET
+    if bucket not in BUCKETS:
+        raise KeyError(f"Unknown bucket: {bucket}")
+    return bucket
+
+# ---------------------- Routes ----------------------
+@s3_catalog_bp.route("/api/s3/presign", methods=["GET"])
+def presign():
+    """
+    GET /api/s3/presign?key=<key>[&bucket=<bucket>][&redirect=1]
+      -> { key, url, expires_in }, or a 302 to the signed URL with redirect=1
+    """
+    key = request.args.get("key", "")
+    bucket = request.args.get("bucket") or S3_BUCKET
+    if not key:
+        return jsonify({"error": "Missing key"}), 400
+    if bucket not in BUCKETS:
+        return jsonify({"error": f"Unknown bucket: {bucket}"}), 400
+    try:
+        url = catalog_for(bucket).presign(key)
+    except Exception as e:
+        print("❌ Presign error:", e)
+        return jsonify({"error": str(e)}), 500
+    if request.args.get("redirect") == "1":
+        return redirect(url, code=302)
+    return jsonify({"key": key, "url": url, "expires_in": PRESIGN_EXPIRES_S})
+
+@s3_catalog_bp.route("/api/s3/catalog/search", methods=["GET"])
+def catalog_search():
+    """GET /api/s3/catalog/search?q=<name part>[&db=<db prefix>][&bucket=][&limit=] -> { files }"""
+    q = (request.args.get("q") or "").strip()
+    if not q:
+        return jsonify({"files": []})
+    try:
+        bucket = _bucket_arg()
+        limit = max(1, min(MAX_PAGE, int(request.args.get("limit", 100))))
+        items = catalog_for(bucket).search(q, request.args.get("db"), limit)
+    except KeyError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print("❌ S3 catalog search error:", e)
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"files": _with_urls(bucket, items)})
+
+@s3_catalog_bp.route("/api/s3/catalog/dbs", methods=["GET"])
+def catalog_dbs():
+    """GET /api/s3/catalog/dbs[?bucket=][&ext=pdf] -> { dbs: [ { db, files, bytes } ] }"""
+    try:
+        bucket = _bucket_arg()
+        return jsonify({"dbs": catalog_for(bucket).db_counts(request.args.get("ext", ""))})
+    except KeyError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print("❌ S3 catalog counts error:", e)
+        return jsonify({"error": str(e)}), 500
+
+@s3_catalog_bp.route("/api/s3/catalog/stats", methods=["GET"])
+def catalog_stats():
+    with _catalogs_lock:
+        catalogs = list(_catalogs.values())
+    return jsonify({c.bucket: c.stats() for c in catalogs})
+
+@s3_catalog_bp.route("/api/s3/catalog/refresh", methods=["POST"])
+def catalog_refresh():
+    """POST { bucket?, prefix? } -> re-sync the mirror now (only what changed is written)"""
+    data = request.get_json(silent=True) or {}
+    bucket = data.get("bucket") or S3_BUCKET
+    if bucket not in BUCKETS:
+        return jsonify({"error": f"Unknown bucket: {bucket}"}), 400
+    try:
+        catalog_for(bucket).sync(data.get("prefix") or "")
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify(catalog_for(bucket).stats())
@@ -0,0 +1,54 @@
+# s3_storage.py
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+
+# ---------------------- CONFIG ----------------------
+S3_BUCKET = os.environ.get("S3_PDF_BUCKET", "geolabs-db-pdfs")
+MB = 1024 * 1024
+
+# Large PDFs go up as parallel multipart parts instead of one long PUT
+S3_TRANSFER = TransferConfig(
+    multipart_threshold=int(os.environ.get("S3_MULTIPART_THRESHOLD_MB", "8")) * MB,
+    multipart_chunksize=int(os.environ.get("S3_MULTIPART_CHUNK_MB", "8")) * MB,
+    max_concurrency=int(os.environ.get("S3_PART_CONCURRENCY", "8")),
+    use_threads=True,
+)
+# Whole-file uploads running at once (each uses up to max_concurrency part threads)
+S3_UPLOAD_WORKERS = int(os.environ.get("S3_UPLOAD_WORKERS", "4"))
+
+# One client for the process; boto3 clients are thread-safe
+s3 = boto3.client("s3")
+_upload_pool = ThreadPoolExecutor(max_workers=S3_UPLOAD_WORKERS, thread_name_prefix="s3-upload")
+
+# ---------------------- Uploads ----------------------
+def s3_key(db_name, file_name, prefix=""):
+    return "/".join(x for x in [db_name.strip("/"), prefix.strip("/"), file_name] if x).replace("//", "/")
+
+def upload_pdf_to_s3(local_path, db_name, file_name, prefix=""):
+    """Uploads to s3 as {db_name}/{prefix}/{file_name} and returns a presigned URL"""
+    key = s3_key(db_name, file_name, prefix)
+    try:
+        s3.upload_file(
+            Filename=local_path,
+            Bucket=S3_BUCKET,
+            Key=key,
+            ExtraArgs={"ContentType": "application/pdf"},
+            Config=S3_TRANSFER,
+        )
+        url = s3.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": S3_BUCKET, "Key": key},
+            ExpiresIn=3600,
+        )
+        print(f"✅ Uploaded to S3: {key}")
+        return key, url
+    except Exception as e:
+        print(f"❌ S3 upload failed: {e}")
+        return None, None
+
+def upload_pdf_to_s3_async(local_path, db_name, file_name, prefix=""):
+    """Same as upload_pdf_to_s3 on the shared upload pool; the future resolves to (key, url)."""
+    return _upload_pool.submit(upload_pdf_to_s3, local_path, db_name, file_name, prefix)
@@ -0,0 +1,204 @@
+# thumbnails.py
+import os
+import time
+import tempfile
+import threading
+
+import fitz  # PyMuPDF
+from flask import Blueprint, request, jsonify, send_file
+
+from db_pool import connect
+from s3_storage import s3, S3_BUCKET, S3_TRANSFER, s3_key
+import page_cache
+import pdf_proxy
+import s3_catalog
+
+thumbnails_bp = Blueprint("thumbnails", __name__)
+
+# ---------------------- CONFIG ----------------------
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, "uploads", "cache")
+THUMB_DIR = os.path.join(CACHE_DIR, "thumbs")
+INDEX_DB = os.path.join(CACHE_DIR, "thumbs.sqlite3")
+THUMB_DPI = int(os.environ.get("THUMB_DPI", "48"))       # ~400px wide for a letter page
+MIN_DPI, MAX_DPI = 24, int(os.environ.get("THUMB_MAX_DPI", "200"))
+
+# PyMuPDF isn't thread-safe; renders are short at thumbnail DPI, so one at a time
+_render_lock = threading.Lock()
+_init_lock = threading.Lock()
+_ready = False
+_stats = {"hits": 0, "rendered": 0, "downloads": 0}
+
+# ---------------------- DB bootstrap ----------------------
+def _ensure():
+    global _ready
+    if _ready:
+        return
+    with _init_lock:
+        if _ready:
+            return
+        os.makedirs(THUMB_DIR, exist_ok=True)
+        with connect(INDEX_DB) as conn:
+            # S3 object -> content hash, so a thumbnail request doesn't need the PDF bytes
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS thumb_sources (
+                    bucket TEXT,
+                    key TEXT,
+                    pdf_sha TEXT,
+                    etag TEXT,            -- NULL until first seen in the S3 catalog
+                    pages INTEGER,
+                    updated_at REAL,
+                    PRIMARY KEY (bucket, key)
+                )
+            """)
+        _ready = True
+
+# ---------------------- Rendering ----------------------
+def clamp_dpi(dpi):
+    try:
+        return max(MIN_DPI, min(MAX_DPI, int(dpi)))
+    except (TypeError, ValueError):
+        return THUMB_DPI
+
+def thumb_path(pdf_sha, page=0, dpi=THUMB_DPI):
+    """Content-addressed: same PDF bytes, page and DPI -> same file, whatever the PDF is called."""
+    return os.path.join(THUMB_DIR, pdf_sha[:2], f"{pdf_sha}_p{page}_{dpi}.png")
+
+def render_page(pdf_path, page=0, dpi=THUMB_DPI, pdf_sha=None):
+    """PNG path for one page, rendering it only if it isn't cached yet. Returns (path, page_count)."""
+    _ensure()
+    pdf_sha = pdf_sha or page_cache.file_sha256(pdf_path)
+    path = thumb_path(pdf_sha, page, dpi)
+    if os.path.exists(path):
+        _stats["hits"] += 1
+        return path, None
+    with _render_lock:
+        if os.path.exists(path):
+            return path, None
+        with fitz.open(pdf_path) as doc:
+            if not 0 <= page < doc.page_count:
+                raise IndexError(f"Page {page + 1} out of range (1-{doc.page_count})")
+            pix = doc[page].get_pixmap(dpi=dpi)
+            page_count = doc.page_count
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        pix.save(tmp, output="png")
+        os.replace(tmp, path)
+    _stats["rendered"] += 1
+    return path, page_count
+
+def remember_source(bucket, key, pdf_sha, pages=None, etag=None):
+    _ensure()
+    with connect(INDEX_DB) as conn:
+        conn.execute("INSERT OR REPLACE INTO thumb_sources VALUES (?, ?, ?, ?, ?, ?)",
+                     (bucket, key, pdf_sha, etag, pages, time.time()))
+
+def pregenerate(pdf_path, pdf_sha, db_name, file_name, track=print):
+    """Called from embed_to_db: first-page thumbnail for {db_name}/{file_name}, ready before anyone asks."""
+    try:
+        path, pages = render_page(pdf_path, 0, THUMB_DPI, pdf_sha)
+        remember_source(S3_BUCKET, s3_key(db_name, file_name), pdf_sha, pages)
+        track("🖼️ First-page thumbnail ready")
+        return path
+    except Exception as e:
+        print(f"⚠️ Thumbnail pre-generation failed for {file_name}:", e)
+        return None
+
+def _source_sha(bucket, key):
+    """Known content hash for an S3 object, or None if unknown / the object changed since."""
+    _ensure()
+    with connect(INDEX_DB) as conn:
+        row = conn.execute("SELECT pdf_sha, etag FROM thumb_sources WHERE bucket = ? AND key = ?",
+                           (bucket, key)).fetchone()
+    if not row:
+        return None
+    pdf_sha, etag = row
+    current = s3_catalog.catalog_for(bucket).etag(key)
+    if etag and current and etag != current:
+        return None
+    if current and not etag:
+        # Recorded at index time, before the upload finished; pin it to what S3 holds now
+        with connect(INDEX_DB) as conn:
+            conn.execute("UPDATE thumb_sources SET etag = ? WHERE bucket = ? AND key = ?", (current, bucket, key))
+    return pdf_sha
+
+def thumbnail_for_key(bucket, key, page=0, dpi=THUMB_DPI):
+    """Rendered page for an S3 object: cached PNG, else render from the PDF proxy cache or a one-off download."""
+    pdf_sha = _source_sha(bucket, key)
+    if pdf_sha and os.path.exists(thumb_path(pdf_sha, page, dpi)):
+        _stats["hits"] += 1
+        return thumb_path(pdf_sha, page, dpi)
+
+    cached = pdf_proxy.lookup(bucket, key)
+    if cached:
+        path, pages = render_page(cached[0], page, dpi, pdf_sha)
+        pdf_sha = pdf_sha or page_cache.file_sha256(cached[0])
+        remember_source(bucket, key, pdf_sha, pages, s3_catalog.catalog_for(bucket).etag(key))
+        return path
+
+    fd, tmp = tempfile.mkstemp(suffix=".pdf")
+    os.close(fd)
+    try:
+        s3.download_file(bucket, key, tmp, Config=S3_TRANSFER)
+        _stats["downloads"] += 1
+        pdf_sha = page_cache.file_sha256(tmp)
+        path, pages = render_page(tmp, page, dpi, pdf_sha)
+        remember_source(bucket, key, pdf_sha, pages, s3_catalog.catalog_for(bucket).etag(key))
+        return path
+    finally:
+        os.remove(tmp)
+
+def thumb_stats():
+    _ensure()
+    files, size = 0, 0
+    for dirpath, _, names in os.walk(THUMB_DIR):
+        for name in names:
+            if name.endswith(".png"):
+                files += 1
+                size += os.path.getsize(os.path.join(dirpath, name))
+    with connect(INDEX_DB) as conn:
+        sources = conn.execute("SELECT COUNT(*) FROM thumb_sources").fetchone()[0]
+    return {"dir": THUMB_DIR, "files": files, "bytes": size, "sources": sources, "default_dpi": THUMB_DPI, **_stats}
+
+# ---------------------- Routes ----------------------
+@thumbnails_bp.route("/api/thumbnail", methods=["GET"])
+def thumbnail():
+    """
+    GET /api/thumbnail?key=<s3 key>[&bucket=]            (or ?db=<db_name>&file=<file name>)
+                      [&page=1][&dpi=48]
+    Returns image/png. Immutable per PDF content, so browsers may cache it.
+    """
+    bucket = request.args.get("bucket") or S3_BUCKET
+    key = request.args.get("key") or ""
+    if not key and request.args.get("db") and request.args.get("file"):
+        key = s3_key(request.args["db"], request.args["file"])
+    if not key:
+        return jsonify({"error": "Missing key (or db + file)"}), 400
+    if bucket not in s3_catalog.BUCKETS:
+        return jsonify({"error": f"Unknown bucket: {bucket}"}), 400
+    try:
+        page = max(1, int(request.args.get("page", 1))) - 1
+    except ValueError:
+        return jsonify({"error": "page must be a number"}), 400
+    dpi = clamp_dpi(request.args.get("dpi", THUMB_DPI))
+
+    try:
+        path = thumbnail_for_key(bucket, key, page, dpi)
+    except IndexError as e:
+        return jsonify({"error": str(e)}), 404
+    except s3.exceptions.ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+            return jsonify({"error": f"Not found: {key}"}), 404
+        print("❌ Thumbnail error:", e)
+        return jsonify({"error": str(e)}), 500
+    except Exception as e:
+        print("❌ Thumbnail error:", e)
+        return jsonify({"error": str(e)}), 500
+    return send_file(path, mimetype="image/png", conditional=True, max_age=86400)
+
+@thumbnails_bp.route("/api/thumbnail/stats", methods=["GET"])
+def thumbnail_stats():
+    try:
+        return jsonify(thumb_stats())
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,328 @@
+# work_orders.py
+import os
+import time
+import bisect
+import threading
+from collections import defaultdict
+
+from db_pool import connect
+
+TABLE_NAME = "pr_data"
+FIELDS = ("project_wo", "client", "project", "pr", "date")
+NOT_FOUND = {k: "Not Found" for k in FIELDS}
+
+# Upper bound for a prefix range scan: every string starting with `p` sorts below p + U+10FFFF
+_PREFIX_END = "\U0010ffff"
+# Rows per VALUES() batch (4 bound params each, well under SQLite's variable limit)
+_BATCH = 500
+
+# ---------------------- Normalization ----------------------
+def ascii_upper(s):
+    """Upper-case ASCII letters only, like SQLite's UPPER() / NOCASE."""
+    return s.upper() if s.isascii() else "".join(c.upper() if c.isascii() else c for c in s)
+
+def normalize_work_order(wo):
+    """
+    Returns (original_wo, lookups) where lookups is a list of (prefix, ordered) tried in order:
+      8482-00A -> [('8482-00(A)', False)]
+      8210     -> [('8210-', True), ('8210', False)]   lowest 8210-XX first, then plain prefix
+      other    -> [(wo, False)]
+    Prefixes are upper-cased to match the UPPER(WO) index (same as LIKE ... COLLATE NOCASE).
+    `ordered` means "lowest WO wins"; otherwise the first row in table order wins (LIMIT 1).
+    """
+    original_wo = str(wo or "").strip()
+    key = ascii_upper(original_wo)
+    if len(original_wo) >= 3 and original_wo[-1].isalpha():
+        return original_wo, [(f"{key[:-1]}({key[-1]})", False)]
+    if '-' not in original_wo and len(original_wo) == 4:
+        return original_wo, [(f"{key}-", True), (key, False)]
+    return original_wo, [(key, False)]
+
+def ensure_wo_index(conn):
+    """Expression index on UPPER(WO) so prefix lookups are index range scans."""
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_pr_data_wo_upper ON {TABLE_NAME}(UPPER(WO))")
+
+def row_to_match(original_wo, row):
+    if not row:
+        return {"work_order": original_wo, **NOT_FOUND}
+    return {
+        "work_order": original_wo,
+        "project_wo": row[0],
+        "client": row[1],
+        "project": row[2],
+        "pr": row[3],
+        "date": row[4]
+    }
+
+# ---------------------- Batched SQL resolver ----------------------
+def _first_rowids(conn, queries):
+    """
+    queries: [(pos, prefix, ordered)] -> {pos: rowid} for the ones that matched.
+    One statement per batch; each VALUES row becomes an index range probe.
+    """
+    found = {}
+    for start in range(0, len(queries), _BATCH):
+        batch = queries[start:start + _BATCH]
+        values = ",".join("(?, ?, ?, ?)" for _ in batch)
+        params = []
+        for pos, prefix, ordered in batch:
+            params += [pos, prefix, prefix + _PREFIX_END, 1 if ordered else 0]
+        rows = conn.execute(f"""
+            WITH q(pos, lo, hi, ordered) AS (VALUES {values})
+            SELECT q.pos,
+                   CASE WHEN q.ordered THEN
+                       (SELECT p.rowid FROM {TABLE_NAME} p
+                        WHERE UPPER(p.WO) >= q.lo AND UPPER(p.WO) < q.hi
+                        ORDER BY UPPER(p.WO), p.rowid LIMIT 1)
+                   ELSE
+                       (SELECT MIN(p.rowid) FROM {TABLE_NAME} p
+                        WHERE UPPER(p.WO) >= q.lo AND UPPER(p.WO) < q.hi)
+                   END
+            FROM q
+        """, params).fetchall()
+        found.update({pos: rid for pos, rid in rows if rid is not None})
+    return found
+
+def resolve_work_orders(conn, work_orders):
+    """
+    Resolve a list of work orders against pr_data with a handful of set-based queries.
+    Returns one match dict per input, in input order ("Not Found" fields when unmatched).
+    """
+    normalized = [normalize_work_order(wo) for wo in work_orders]
+    rowids = {}
+    pending = list(range(len(normalized)))
+    step = 0
+    while pending:
+        queries = [(pos, *normalized[pos][1][step]) for pos in pending if step < len(normalized[pos][1])]
+        if not queries:
+            break
+        hits = _first_rowids(conn, queries)
+        rowids.update(hits)
+        pending = [pos for pos, _, _ in queries if pos not in hits]
+        step += 1
+
+    rows = {}
+    ids = sorted(set(rowids.values()))
+    for start in range(0, len(ids), _BATCH):
+        chunk = ids[start:start + _BATCH]
+        qmarks = ",".join("?" for _ in chunk)
+        for r in conn.execute(
+            f"SELECT rowid, WO, Client, Project, PR, Date FROM {TABLE_NAME} WHERE rowid IN ({qmarks})", chunk
+        ):
+            rows[r[0]] = r[1:]
+
+    return [
+        row_to_match(original_wo, rows.get(rowids.get(pos)))
+        for pos, (original_wo, _) in enumerate(normalized)
+    ]
+
+# ---------------------- In-memory index ----------------------
+class WorkOrderIndex:
+    """
+    Sorted in-memory copy of pr_data work orders for the OCR -> PR lookup.
+
+    Keys are UPPER(WO) sorted with rowid as tie-break, so:
+      - ordered prefix ("lowest 8210-XX") is the first key in the bisected range
+      - unordered prefix (SQL LIMIT 1, i.e. first row in table order) is the
+        minimum rowid in that range, answered by a sparse range-min table
+    Both are O(log n). The snapshot is rebuilt when pr_data.db (or its WAL) changes.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._snapshot = None       # (keys, rowids, sparse, rows)
+        self._signature = None
+        self._fuzzy = None          # (snapshot, FuzzyWorkOrderIndex), built on first fuzzy lookup
+        self.loaded_at = None
+        self.load_ms = None
+
+    def _file_signature(self):
+        sig = []
+        for path in (self.db_path, self.db_path + "-wal"):
+            try:
+                st = os.stat(path)
+                sig.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                sig.append(None)
+        return tuple(sig)
+
+    def refresh(self, force=False):
+        """Reload from pr_data if the DB file changed since the last load."""
+        signature = self._file_signature()
+        if not force and self._snapshot is not None and signature == self._signature:
+            return False
+        with self._lock:
+            if not force and self._snapshot is not None and signature == self._signature:
+                return False
+            start = time.perf_counter()
+            with connect(self.db_path) as conn:
+                fetched = conn.execute(
+                    f"SELECT rowid, WO, Client, Project, PR, Date FROM {TABLE_NAME} WHERE WO IS NOT NULL"
+                ).fetchall()
+            entries = sorted((ascii_upper(str(r[1])), r[0]) for r in fetched)
+            keys = [k for k, _ in entries]
+            rowids = [rid for _, rid in entries]
+            rows = {r[0]: r[1:] for r in fetched}
+            self._snapshot = (keys, rowids, _build_sparse_min(rowids), rows)
+            self._signature = signature
+            self.loaded_at = time.time()
+            self.load_ms = round((time.perf_counter() - start) * 1000, 1)
+            print(f"✅ Work-order index loaded: {len(keys)} WOs in {self.load_ms} ms")
+            return True
+
+    def _current(self):
+        self.refresh()
+        return self._snapshot
+
+    # ---------------------- queries ----------------------
+    def _first_with_prefix(self, snapshot, prefix, ordered):
+        """Same row as `WO LIKE 'prefix%' COLLATE NOCASE` with ORDER BY WO (ordered) or LIMIT 1."""
+        keys, rowids, sparse, rows = snapshot
+        lo = bisect.bisect_left(keys, prefix)
+        hi = bisect.bisect_left(keys, prefix + _PREFIX_END, lo)
+        if lo >= hi:
+            return None
+        if ordered:
+            return rows[rowids[lo]]
+        return rows[_range_min(sparse, lo, hi)]
+
+    def resolve(self, work_orders):
+        """In-memory equivalent of resolve_work_orders(); results in input order."""
+        snapshot = self._current()
+        out = []
+        for wo in work_orders:
+            original_wo, lookups = normalize_work_order(wo)
+            row = None
+            for prefix, ordered in lookups:
+                row = self._first_with_prefix(snapshot, prefix, ordered)
+                if row:
+                    break
+            out.append(row_to_match(original_wo, row))
+        return out
+
+    # ---------------------- fuzzy ----------------------
+    def _fuzzy_for(self, snapshot):
+        cached = self._fuzzy
+        if cached is not None and cached[0] is snapshot:
+            return cached[1]
+        with self._lock:
+            cached = self._fuzzy
+            if cached is None or cached[0] is not snapshot:
+                start = time.perf_counter()
+                cached = self._fuzzy = (snapshot, FuzzyWorkOrderIndex(snapshot))
+                print(f"✅ Fuzzy work-order index built in {round((time.perf_counter() - start) * 1000, 1)} ms")
+        return cached[1]
+
+    def build_fuzzy(self):
+        """Build the fuzzy index for the current snapshot ahead of the first request."""
+        self._fuzzy_for(self._current())
+
+    def resolve_fuzzy(self, work_orders, max_distance=1, limit=3):
+        """
+        resolve() plus, for every "Not Found" entry, a `candidates` list of the closest
+        pr_data work orders ({project_wo, client, project, pr, date, distance}).
+        """
+        snapshot = self._current()
+        fuzzy = self._fuzzy_for(snapshot)
+        out = self.resolve(work_orders)
+        for match in out:
+            if match["project_wo"] != "Not Found":
+                continue
+            _, lookups = normalize_work_order(match["work_order"])
+            match["candidates"] = [
+                {**{k: v for k, v in row_to_match(match["work_order"], snapshot[3][rid]).items() if k != "work_order"},
+                 "distance": dist}
+                for dist, _, rid in fuzzy.candidates(lookups[-1][0], max_distance, limit)
+            ]
+        return out
+
+    def stats(self):
+        return {
+            "db_path": self.db_path,
+            "loaded": self._snapshot is not None,
+            "fuzzy_ready": self._fuzzy is not None and self._fuzzy[0] is self._snapshot,
+            "work_orders": len(self._snapshot[0]) if self._snapshot else 0,
+            "loaded_at": self.loaded_at,
+            "load_ms": self.load_ms,
+        }
+
+def _build_sparse_min(values):
+    """table[k][i] = min(values[i : i + 2**k])"""
+    table = [values]
+    k = 1
+    while (1 << k) <= len(values):
+        prev, half = table[-1], 1 << (k - 1)
+        width = len(values) - (1 << k) + 1
+        table.append(list(map(min, prev[:width], prev[half:half + width])))
+        k += 1
+    return table
+
+def _range_min(table, lo, hi):
+    k = (hi - lo).bit_length() - 1
+    return min(table[k][lo], table[k][hi - (1 << k)])
+
+# ---------------------- Fuzzy matching ----------------------
+FUZZY_MAX_DISTANCE = 1   # the index holds single deletions only; recall is exact up to 1
+
+def edit_distance(a, b, max_distance):
+    """Levenshtein distance, or max_distance + 1 once it is certain to exceed max_distance."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        if min(cur) > max_distance:
+            return max_distance + 1
+        prev = cur
+    return prev[-1]
+
+def _deletes(term):
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+class FuzzyWorkOrderIndex:
+    """
+    Deletion-neighbourhood candidate generator (SymSpell style) over a WorkOrderIndex snapshot.
+
+    Every term is indexed under itself and each single-character deletion, so one wrong
+    digit, a dropped/extra character or a misread suffix letter is found with ~len(query)
+    dict probes instead of scanning pr_data. Candidates are verified with edit_distance().
+    Terms are full work orders plus their bases ("8210" -> lowest 8210-XX), mirroring
+    the exact-match rules.
+    """
+
+    def __init__(self, snapshot):
+        keys, rowids, _, _ = snapshot
+        terms, bases = {}, {}
+        for key, rid in zip(keys, rowids):       # sorted by (key, rowid)
+            terms.setdefault(key, rid)           # first in table order
+            base, dash, _ = key.partition("-")
+            if dash and base:
+                bases.setdefault(base, rid)      # lowest base-XX
+        for base, rid in bases.items():
+            terms.setdefault(base, rid)          # an exact term keeps its own rowid
+        self.terms = terms
+        self.variants = defaultdict(list)
+        for term in terms:
+            self.variants[term].append(term)
+            for variant in _deletes(term):
+                self.variants[variant].append(term)
+
+    def candidates(self, query, max_distance=1, limit=3):
+        """[(distance, term, rowid)] closest first; max_distance is clamped to FUZZY_MAX_DISTANCE."""
+        query = ascii_upper(str(query).strip())
+        max_distance = max(0, min(int(max_distance), FUZZY_MAX_DISTANCE))
+        if not query:
+            return []
+        seen = set()
+        for probe in {query, *_deletes(query)}:
+            seen.update(self.variants.get(probe, ()))
+        scored = []
+        for term in seen:
+            dist = edit_distance(query, term, max_distance)
+            if dist <= max_distance:
+                scored.append((dist, term, self.terms[term]))
+        scored.sort()
+        return scored[:limit]
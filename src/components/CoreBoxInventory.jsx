@@ -69,6 +69,10 @@ export default function CoreBoxInventory() {
   const [toast, setToast] = useState(null); // { text, actionText, onAction }
   const toastTimer = useRef(null);
 
+  // keyset paging: cursors.current[n] is the next_cursor that page n-1 returned
+  const cursors = useRef({});
+  const cursorScope = useRef("");
+
   const [historyOpen, setHistoryOpen] = useState(false);
   const [changes, setChanges] = useState([]);
   const [changesLoading, setChangesLoading] = useState(false);
@@ -115,6 +119,11 @@ export default function CoreBoxInventory() {
   };
 
   const fetchRows = async () => {
+    const scope = JSON.stringify([q, island, year, complete, keepOrDump, expiredOnly, sortBy, sortDir, pageSize]);
+    if (cursorScope.current !== scope) {
+      cursors.current = {};
+      cursorScope.current = scope;
+    }
     const params = {
       q: q || undefined,
       island: island || undefined,
@@ -126,11 +135,13 @@ export default function CoreBoxInventory() {
       sort_dir: sortDir,
       page,
       page_size: pageSize,
+      cursor: cursors.current[page], // server falls back to page/offset without one
     };
     try {
       const res = await axios.get(`${API_URL}/api/core-boxes`, { params });
       setRows(res.data.rows || []);
       setCount(res.data.total || 0);
+      if (res.data.next_cursor) cursors.current[page + 1] = res.data.next_cursor;
       setSelected(new Set()); // reset selection on load
     } catch (e) {
       console.error("Failed to fetch core boxes", e);
@@ -259,8 +259,25 @@ export default function DBAdmin() {
             setStatusLine(`Uploading ${item.name}… ${p}%`);
           }
         });
-        const stepLines = res.data?.steps || [];
-        if (stepLines.length) setSteps(prev => [...prev, ...stepLines]);
+        // Indexing runs as a background job; follow its messages/progress until it finishes
+        const jobId = res.data?.job_id;
+        let job = { status: 'done' };
+        let cursor = 0;
+        while (jobId && !controller.signal.aborted) {
+          const jr = await axios.get(`${API_URL}/api/jobs/${jobId}`, { params: { since: cursor }, signal: controller.signal });
+          job = jr.data || {};
+          cursor = job.cursor ?? cursor;
+          const stepLines = job.messages || [];
+          if (stepLines.length) setSteps(prev => [...prev, ...stepLines]);
+          setQueue(prev => prev.map(q => q.name === item.name ? { ...q, progress: job.progress ?? q.progress } : q));
+          setStatusLine(`Indexing ${item.name}… ${job.progress ?? 0}%`);
+          if (job.status === 'done' || job.status === 'failed') break;
+          await new Promise(r => setTimeout(r, 1000));
+        }
+        if (job.status === 'failed') {
+          setQueue(prev => prev.map(q => q.name === item.name ? { ...q, status: 'error', error: job.error || 'Indexing failed', controller: null } : q));
+          continue;
+        }
         setQueue(prev => prev.map(q => q.name === item.name ? { ...q, status: 'done', progress: 100, controller: null } : q));
       } catch (e) {
         if (controller.signal.aborted) {